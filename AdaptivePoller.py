@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Optional
+
+from RequestQueue import RequestCancelled
+
+
+class AdaptivePoller:
+    """
+    根据内容增长情况调整轮询间隔的调度器
+
+    开始时快速轮询；内容持续增长或一直为空时按指数退避拉长间隔，并参考观察到的增长速度，
+    使每次轮询之间新增的字符数不超过 target_growth；内容停止增长时（通常即将完成）
+    缩短间隔，尽快发现完成状态。所有等待都不会超过请求的截止时间，请求被取消时立即结束等待。
+    """
+
+    def __init__(self,
+                 deadline: float,
+                 initial_interval: float = 0.25,
+                 max_interval: float = 5.0,
+                 backoff: float = 1.6,
+                 target_growth: Optional[int] = None,
+                 cancelled: Optional[threading.Event] = None):
+        self.deadline = deadline
+        """截止时间戳"""
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.target_growth = target_growth
+        """两次轮询之间期望的最大新增字符数，None 表示只做指数退避"""
+        self.cancelled = cancelled or threading.Event()
+        self.interval = initial_interval
+        self.rate: Optional[float] = None
+        """平滑后的内容增长速度（字符/秒）"""
+        self.polls = 0
+        self._last_length = 0
+        self._last_time: Optional[float] = None
+
+    def observe(self, content_length: int) -> float:
+        """记录一次轮询结果，返回下一次轮询前应等待的秒数"""
+        now = time.time()
+        self.polls += 1
+
+        if self._last_time is not None:
+            growth = content_length - self._last_length
+            elapsed = max(now - self._last_time, 1e-3)
+
+            if growth > 0:
+                rate = growth / elapsed
+                self.rate = rate if self.rate is None else 0.7 * self.rate + 0.3 * rate
+                if self._last_length == 0:
+                    # 内容刚开始出现，之前空等时拉长的间隔不再适用
+                    self.interval = self.initial_interval
+                else:
+                    self.interval = self.interval * self.backoff
+                if self.target_growth:
+                    self.interval = min(self.interval, self.target_growth / self.rate)
+            elif content_length > 0:
+                self.interval = self.interval / self.backoff
+            else:
+                # 还没有任何内容（排队或长时间思考），同样按指数退避，不必一直快速轮询
+                self.interval = self.interval * self.backoff
+
+        self.interval = min(max(self.interval, self.initial_interval), self.max_interval)
+        self._last_length = content_length
+        self._last_time = now
+        return min(self.interval, self.remaining())
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.time(), 0.0)
+
+    def expired(self) -> bool:
+        return time.time() >= self.deadline
+
+    def wait(self, content_length: int):
+        """
+        记录轮询结果并等待到下一次轮询，超过截止时间时抛出 TimeoutError，
+        被取消时抛出 RequestCancelled
+        """
+        if self.expired():
+            raise TimeoutError(f"Chat completion timed out after {self.polls} polls")
+        if self.cancelled.wait(self.observe(content_length)):
+            raise RequestCancelled("Request was cancelled while waiting for completion")
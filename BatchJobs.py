@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+import time
+import uuid
+import logging as logger
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from openai.types.chat.chat_completion import ChatCompletion
+
+import Metrics
+from RequestQueue import AdmissionError
+
+
+class BatchInputError(ValueError):
+    """上传的 JSONL 无法解析，line 为出错的行号（从 1 开始）"""
+
+    def __init__(self, message: str, line: int):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def parse_batch(data: bytes) -> List[Dict[str, Any]]:
+    """
+    解析上传的 JSONL，每行是 {"custom_id": ..., "body": {...}}（OpenAI batch 格式），
+    或者直接是 chat completion 请求体；返回 [{"custom_id", "body"}]
+    """
+    items = []
+    for number, line in enumerate(data.decode("utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BatchInputError(f"invalid JSON: {e}", number)
+        if not isinstance(item, dict):
+            raise BatchInputError("expected a JSON object", number)
+        body = item.get("body", item)
+        if not isinstance(body, dict) or not isinstance(body.get("messages"), list) or not body["messages"]:
+            raise BatchInputError("request has no messages", number)
+        items.append({"custom_id": str(item.get("custom_id", len(items))), "body": body})
+    if not items:
+        raise BatchInputError("no requests", 1)
+    return items
+
+
+class BatchJobs:
+    """
+    批量任务：上传的请求逐行交给 run 处理，结果逐行追加到 results.jsonl
+
+    每个任务保存在 directory/<任务ID>/ 下：input.jsonl 为请求，state.json 为状态，
+    results.jsonl 既是输出也是进度记录，重启后跳过已有结果的行，从中断处继续。
+    同时处理的请求不超过 concurrency 个，rate 大于 0 时每秒开始的请求不超过 rate 个；
+    请求因过载被拒绝时等待 retry_after 后重试，其他异常作为该行的错误写入结果。
+    run(body, stop) 在 stop 被设置时应尽快放弃请求。
+    """
+
+    def __init__(self, directory: str, run: Callable[[Dict[str, Any], threading.Event], ChatCompletion],
+                 rate: float = 0, concurrency: int = 1):
+        self.directory = directory
+        self.run = run
+        self.rate = rate
+        self.concurrency = max(1, concurrency)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        """任务ID -> 状态"""
+        self._pending: Deque[str] = deque()
+        self._lock = threading.Condition()
+        self._slots = threading.Semaphore(self.concurrency)
+        self._next_start = 0.0
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run_jobs, name="batch-runner", daemon=True)
+
+    def start(self):
+        self.resume()
+        self.thread.start()
+
+    def stop(self):
+        """停止提交新的请求并取消进行中的请求；进行中的任务保持 running 状态，下次启动时继续"""
+        self._stopped.set()
+        with self._lock:
+            self._lock.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.directory, job_id, name)
+
+    def _save_state(self, job: Dict[str, Any]):
+        path = self._path(job["id"], "state.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in job.items() if not k.startswith("_")}, f)
+        os.replace(path + ".tmp", path)
+
+    def submit(self, data: bytes) -> Dict[str, Any]:
+        """保存上传的 JSONL 并排队，输入无效时抛出 BatchInputError"""
+        items = parse_batch(data)
+        job_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.directory, job_id))
+        with open(self._path(job_id, "input.jsonl"), "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        open(self._path(job_id, "results.jsonl"), "w").close()
+
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "total": len(items),
+            "completed": 0,
+            "failed": 0,
+        }
+        self._save_state(job)
+        with self._lock:
+            self.jobs[job_id] = job
+            self._pending.append(job_id)
+            self._lock.notify_all()
+        logger.info(f"Batch {job_id} queued with {len(items)} request(s)")
+        return self.status(job_id)
+
+    def resume(self):
+        """读取磁盘上的任务，未完成的重新排队"""
+        if not os.path.isdir(self.directory):
+            return
+        jobs = []
+        for job_id in os.listdir(self.directory):
+            try:
+                with open(self._path(job_id, "state.json"), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            done = self._load_results(job)
+            job["completed"] = len(done)
+            jobs.append(job)
+
+        with self._lock:
+            for job in sorted(jobs, key=lambda j: j["created_at"]):
+                self.jobs[job["id"]] = job
+                if job["status"] in ("queued", "running"):
+                    self._pending.append(job["id"])
+                    logger.info(f"Resuming batch {job['id']} at {job['completed']}/{job['total']}")
+
+    def _load_results(self, job: Dict[str, Any]) -> Set[int]:
+        """返回已有结果的行号，并截掉上次中断时写了一半的最后一行"""
+        path = self._path(job["id"], "results.jsonl")
+        done = set()
+        failed = 0
+        valid = 0
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        break
+                    done.add(result["index"])
+                    failed += result["error"] is not None
+                    valid += len(line)
+        except FileNotFoundError:
+            return done
+        if os.path.getsize(path) != valid:
+            os.truncate(path, valid)
+        job["failed"] = failed
+        return done
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return {k: v for k, v in job.items() if not k.startswith("_")} if job else None
+
+    def results_path(self, job_id: str) -> Optional[str]:
+        return self._path(job_id, "results.jsonl") if job_id in self.jobs else None
+
+    def results_size(self, job_id: str) -> int:
+        """结果文件当前的大小；结果在锁内整行写入，按这个大小读取不会读到写了一半的行"""
+        with self._lock:
+            return os.path.getsize(self._path(job_id, "results.jsonl"))
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """不再提交该任务剩余的请求，已经开始的请求仍会写入结果"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in ("queued", "running"):
+                job["status"] = "cancelled"
+                job["finished_at"] = time.time()
+                self._save_state(job)
+        return self.status(job_id)
+
+    def run_jobs(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopped.is_set():
+                    self._lock.wait()
+                if self._stopped.is_set():
+                    return
+                job = self.jobs[self._pending.popleft()]
+            try:
+                self.process(job)
+            except Exception:
+                logger.exception(f"Batch {job['id']} failed")
+                with self._lock:
+                    job["status"] = "failed"
+                    job["finished_at"] = time.time()
+                    self._save_state(job)
+
+    def process(self, job: Dict[str, Any]):
+        with self._lock:
+            if job["status"] not in ("queued", "running"):
+                return
+            job["status"] = "running"
+            job["started_at"] = job["started_at"] or time.time()
+            self._save_state(job)
+
+        done = self._load_results(job)
+        job["completed"] = len(done)
+        with open(self._path(job["id"], "input.jsonl"), encoding="utf-8") as f:
+            items = [json.loads(line) for line in f]
+
+        threads: List[threading.Thread] = []
+        with open(self._path(job["id"], "results.jsonl"), "a", encoding="utf-8") as results:
+            job["_results"] = results
+            for index, item in enumerate(items):
+                if index in done:
+                    continue
+                if not self._acquire_slot():
+                    break
+                if job["status"] != "running":
+                    self._slots.release()
+                    break
+                self._throttle()
+                # 同时运行的线程数已由 _slots 限制；daemon 线程不会阻止进程退出
+                thread = threading.Thread(target=self._run_item, args=(job, index, item),
+                                          name=f"batch-{index}", daemon=True)
+                thread.start()
+                threads.append(thread)
+            # 停止时不等待进行中的请求，它们的结果不再写入，下次启动时重新处理
+            while threads and not self._stopped.is_set():
+                threads[0].join(timeout=1)
+                threads = [thread for thread in threads if thread.is_alive()]
+            with self._lock:
+                job.pop("_results", None)
+
+        with self._lock:
+            if self._stopped.is_set() or job["status"] != "running":
+                return
+            job["status"] = "completed"
+            job["finished_at"] = time.time()
+            self._save_state(job)
+        logger.info(f"Batch {job['id']} completed: {job['completed']} done, {job['failed']} failed")
+
+    def _acquire_slot(self) -> bool:
+        while not self._stopped.is_set():
+            if self._slots.acquire(timeout=1):
+                return True
+        return False
+
+    def _throttle(self):
+        if self.rate <= 0:
+            return
+        now = time.time()
+        self._next_start = max(now, self._next_start)
+        if self._next_start > now:
+            self._stopped.wait(self._next_start - now)
+        self._next_start += 1 / self.rate
+
+    def _run_item(self, job: Dict[str, Any], index: int, item: Dict[str, Any]):
+        result = {"custom_id": item["custom_id"], "index": index, "response": None, "error": None}
+        try:
+            while True:
+                try:
+                    result["response"] = self.run(item["body"], self._stopped).model_dump()
+                    break
+                except AdmissionError as e:
+                    if self._stopped.wait(e.retry_after):
+                        return
+        except Exception as e:
+            result["error"] = {"type": type(e).__name__, "message": str(e)}
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            results = job.get("_results")
+            if results is None or self._stopped.is_set():
+                # 因停止而取消的请求不算失败，下次启动时重新处理
+                return
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results.flush()
+            job["completed"] += 1
+            job["failed"] += result["error"] is not None
+        Metrics.BATCH_REQUESTS.labels("error" if result["error"] else "success").inc()
@@ -1,10 +1,19 @@
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
-import json
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Union, overload
 import time
 
-@dataclass
+try:
+    # 有 orjson 时用它解码，否则退回标准库
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+@dataclass(slots=True)
 class ChatMessage:
+    """
+    单条消息，轮询时用到的字段直接保存；
+    files、tips、search_results 等很少用到的字段留在原始 dict 中，访问时才取出
+    """
     message_id: int
     parent_id: Optional[int]
     model: str
@@ -14,16 +23,88 @@ class ChatMessage:
     ban_regenerate: bool
     status: str
     accumulated_token_usage: int
-    files: List[Any] = field(default_factory=list)
     inserted_at: float = 0.0
     search_enabled: bool = False
-    feedback: Optional[Any] = None
     content: str = ""
     thinking_content: Optional[str] = None
     thinking_elapsed_secs: Optional[float] = None
-    tips: List[Any] = field(default_factory=list)
-    search_status: Optional[Any] = None
-    search_results: Optional[Any] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, msg_data: Dict[str, Any]) -> "ChatMessage":
+        get = msg_data.get
+        return cls(
+            msg_data["message_id"],
+            get("parent_id"),
+            get("model", ""),
+            msg_data["role"],
+            msg_data["thinking_enabled"],
+            msg_data["ban_edit"],
+            msg_data["ban_regenerate"],
+            msg_data["status"],
+            msg_data["accumulated_token_usage"],
+            get("inserted_at", 0.0),
+            get("search_enabled", False),
+            get("content", ""),
+            get("thinking_content"),
+            get("thinking_elapsed_secs"),
+            msg_data,
+        )
+
+    @property
+    def files(self) -> List[Any]:
+        return self.raw.get("files") or []
+
+    @property
+    def tips(self) -> List[Any]:
+        return self.raw.get("tips") or []
+
+    @property
+    def feedback(self) -> Optional[Any]:
+        return self.raw.get("feedback")
+
+    @property
+    def search_status(self) -> Optional[Any]:
+        return self.raw.get("search_status")
+
+    @property
+    def search_results(self) -> Optional[Any]:
+        return self.raw.get("search_results")
+
+class ChatMessageList(Sequence[ChatMessage]):
+    """按需把原始消息 dict 转换为 ChatMessage，轮询通常只访问最后一条"""
+
+    __slots__ = ("_raw", "_items")
+
+    def __init__(self, raw: Optional[List[Dict[str, Any]]] = None):
+        self._raw = raw if raw is not None else []
+        self._items: List[Optional[ChatMessage]] = [None] * len(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    @overload
+    def __getitem__(self, index: int) -> ChatMessage: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[ChatMessage]: ...
+    def __getitem__(self, index: Union[int, slice]) -> Union[ChatMessage, List[ChatMessage]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._raw)))]
+        item = self._items[index]
+        if item is None:
+            item = self._items[index] = ChatMessage.from_dict(self._raw[index])
+        return item
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        for i in range(len(self._raw)):
+            yield self[i]
+
+    def append(self, message: ChatMessage):
+        self._raw.append(message.raw)
+        self._items.append(message)
+
+    def __repr__(self) -> str:
+        return f"ChatMessageList(len={len(self._raw)})"
 
 @dataclass
 class ChatSession:
@@ -42,7 +123,7 @@ class ChatSession:
 @dataclass
 class BizData:
     chat_session: ChatSession
-    chat_messages: List[ChatMessage] = field(default_factory=list)
+    chat_messages: ChatMessageList = field(default_factory=ChatMessageList)
     cache_valid: bool = False
     route_id: Optional[str] = None
 
@@ -59,14 +140,13 @@ class ChatHistoryResponse:
     data: Optional[DataClass] = None
 
     @classmethod
-    def from_json(cls, json_str: str) -> "ChatHistoryResponse":
+    def from_json(cls, json_str: Union[str, bytes]) -> "ChatHistoryResponse":
         """从JSON字符串反序列化为ChatResponse对象"""
-        data = json.loads(json_str)
-        return cls._deserialize(data)
+        return cls.from_dict(loads(json_str))
     
     @classmethod
-    def _deserialize(cls, data: Dict) -> "ChatHistoryResponse":
-        """递归反序列化嵌套结构"""
+    def from_dict(cls, data: Dict) -> "ChatHistoryResponse":
+        """直接从已解码的 dict 构建，消息在访问时才转换，不复制原始数据"""
         
         response = cls(
             code=data.get("code", 0),
@@ -87,7 +167,7 @@ class ChatHistoryResponse:
                 biz_data = data_obj["biz_data"]
                 biz_data_obj = BizData(
                     chat_session=None,  
-                    chat_messages=[],  
+                    chat_messages=ChatMessageList(biz_data.get("chat_messages")),
                     cache_valid=biz_data.get("cache_valid", False),
                     route_id=biz_data.get("route_id")
                 )
@@ -109,31 +189,6 @@ class ChatHistoryResponse:
                         updated_at=session_data["updated_at"]
                     )
                 
-                
-                if "chat_messages" in biz_data:
-                    for msg_data in biz_data["chat_messages"]:
-                        biz_data_obj.chat_messages.append(ChatMessage(
-                            message_id=msg_data["message_id"],
-                            parent_id=msg_data.get("parent_id"),
-                            model=msg_data.get("model", ""),
-                            role=msg_data["role"],
-                            thinking_enabled=msg_data["thinking_enabled"],
-                            ban_edit=msg_data["ban_edit"],
-                            ban_regenerate=msg_data["ban_regenerate"],
-                            status=msg_data["status"],
-                            accumulated_token_usage=msg_data["accumulated_token_usage"],
-                            files=msg_data.get("files", []),
-                            inserted_at=msg_data.get("inserted_at", 0.0),
-                            search_enabled=msg_data.get("search_enabled", False),
-                            feedback=msg_data.get("feedback"),
-                            content=msg_data.get("content", ""),
-                            thinking_content=msg_data.get("thinking_content"),
-                            thinking_elapsed_secs=msg_data.get("thinking_elapsed_secs"),
-                            tips=msg_data.get("tips", []),
-                            search_status=msg_data.get("search_status"),
-                            search_results=msg_data.get("search_results")
-                        ))
-                
                 response.data.biz_data = biz_data_obj
         
         return response
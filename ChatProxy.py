@@ -1,9 +1,18 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from queue import Queue
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
 import threading
 import uuid
+from urllib.parse import urljoin
 import selenium
 import time
-import json
 from openai.types.chat.completion_create_params import CompletionCreateParamsNonStreaming
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 import logging as logger
@@ -17,90 +26,968 @@ from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
 
 from selenium import webdriver
 from selenium.webdriver.firefox.service import Service as FirefoxService
 
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from typing import Any, Dict, List, Optional, Literal, Union, TypedDict
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Literal, Tuple, Union, TypedDict
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 
+import config
+from AdaptivePoller import AdaptivePoller
+from BatchJobs import BatchJobs
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 from ChatHistoryResponse import ChatHistoryResponse
-from ChatProxyEvent import ChatGeneratingEvent, ChatStartedEvent
-from ChatProxyUtils import convert_to_chat_completion
+from ChatPruner import ChatPruner
+from ChatSessionIndex import ChatSessionIndex
+from ChatProxyEvent import (CHAT_DELTA, CHAT_FAILED, CHAT_FINISHED, CHAT_GENERATING, CHAT_STARTED, REQUEST_QUEUED,
+                            ChatDeltaEvent, ChatFailedEvent, ChatFinishedEvent, ChatGeneratingEvent, ChatStartedEvent,
+                            RequestQueuedEvent)
+from ChatProxyUtils import convert_completion_to_chunks, convert_to_chat_completion, convert_to_chat_completion_chunk
+from HttpBackend import HttpSession, HttpSessionExpired, http_client
 from JSCode import ChatHistoryCode, ChatListCode, ChatMutationCode
+from PageScripts import SetInputValueCode, tail_history_script
+import Metrics
+from RequestQueue import AdmissionError, NoHealthyWorkers, QueueWaitTimeout, RequestCancelled, RequestQueue
+from ResponseCache import ResponseCache, cache_key
+from SessionAffinity import SessionAffinity
 from config import CHAT_URL, FIREFOX_BINARY, PROFILE_PATH
+from EventHub import event as event_hub
+
+
+POOL_SIZE: int = getattr(config, "POOL_SIZE", 1)
+"""浏览器池中 WebDriver 的数量"""
+TABS_PER_DRIVER: int = getattr(config, "TABS_PER_DRIVER", 1)
+"""每个 WebDriver 打开的标签页数量，每个标签页同时处理一个请求，比每个请求一个浏览器更省内存"""
+PROFILE_PATHS: Optional[List[str]] = getattr(config, "PROFILE_PATHS", None)
+"""每个 WebDriver 独立使用的 profile 目录，不设置时从 PROFILE_PATH 复制"""
+STREAM_POLL_INTERVAL: float = getattr(config, "STREAM_POLL_INTERVAL", 0.5)
+"""流式模式下获取历史记录的最大间隔（秒）"""
+STREAM_CHUNK_SIZE: int = getattr(config, "STREAM_CHUNK_SIZE", 40)
+"""流式模式下两次获取之间期望的最大新增字符数，生成越快轮询越频繁"""
+SEND_TIMEOUT: float = getattr(config, "SEND_TIMEOUT", 10)
+"""等待输入框可用、消息发出和页面跳转的最长时间（秒）"""
+HUMANIZE_JITTER: Optional[Tuple[float, float]] = getattr(config, "HUMANIZE_JITTER", None)
+"""设置为 (最小, 最大) 秒数时，在按下发送前和两个请求之间随机等待，用于应对反爬检测"""
+REQUEST_TIMEOUT: float = getattr(config, "REQUEST_TIMEOUT", 240)
+"""请求未指定超时时间时的默认截止时间（秒）"""
+POLL_INITIAL_INTERVAL: float = getattr(config, "POLL_INITIAL_INTERVAL", 0.25)
+"""等待完成时的初始轮询间隔（秒）"""
+POLL_MAX_INTERVAL: float = getattr(config, "POLL_MAX_INTERVAL", 5)
+"""等待完成时的最大轮询间隔（秒）"""
+HTTP_BACKEND: bool = getattr(config, "HTTP_BACKEND", False)
+"""开启后历史记录和会话列表直接通过 HTTP 请求获取，浏览器只负责发送消息"""
+BULK_INPUT: bool = getattr(config, "BULK_INPUT", True)
+"""通过脚本一次性写入输入内容，而不是由 send_keys 逐字输入"""
+CACHE_ENABLED: bool = getattr(config, "CACHE_ENABLED", False)
+"""对相同的提示直接返回之前的回复"""
+CACHE_MAX_ENTRIES: int = getattr(config, "CACHE_MAX_ENTRIES", 1024)
+"""内存中缓存的回复数量上限"""
+CACHE_TTL: float = getattr(config, "CACHE_TTL", 3600)
+"""缓存有效期（秒）"""
+CACHE_PATH: Optional[str] = getattr(config, "CACHE_PATH", None)
+"""设置后缓存同时写入该 sqlite 文件，重启后仍然有效"""
+COALESCE_REQUESTS: bool = getattr(config, "COALESCE_REQUESTS", True)
+"""相同的请求正在处理时，新请求直接等待其结果而不再单独生成"""
+MAX_QUEUE_DEPTH: int = getattr(config, "MAX_QUEUE_DEPTH", 256)
+"""排队请求数上限，超过时返回 429，0 表示不限制"""
+MAX_QUEUE_WAIT: float = getattr(config, "MAX_QUEUE_WAIT", REQUEST_TIMEOUT)
+"""请求最长排队时间（秒），预计等待超过该值时拒绝，0 表示不限制"""
+PRIORITY_CLASSES: Dict[str, int] = getattr(config, "PRIORITY_CLASSES", {"high": 0, "normal": 1, "low": 2})
+"""优先级名称到队列优先级的映射，数值越小越先处理"""
+API_KEY_PRIORITIES: Dict[str, str] = getattr(config, "API_KEY_PRIORITIES", {})
+"""API key 到优先级名称的映射，优先于请求头 X-Priority"""
+DEFAULT_PRIORITY: str = getattr(config, "DEFAULT_PRIORITY", "normal")
+SCRIPT_TIMEOUT: float = getattr(config, "SCRIPT_TIMEOUT", 30)
+"""页面中异步脚本的默认超时时间（秒）"""
+STOP_BUTTON_SELECTOR: Optional[str] = getattr(config, "STOP_BUTTON_SELECTOR", None)
+"""页面中停止生成按钮的 CSS 选择器，请求取消时点击；不设置时只停止等待"""
+
+SESSION_AFFINITY: bool = getattr(config, "SESSION_AFFINITY", True)
+"""多轮对话的前缀与之前的回复一致时，回到原会话只发送新的用户消息，而不是把整段对话发到新会话"""
+SESSION_AFFINITY_MAX_ENTRIES: int = getattr(config, "SESSION_AFFINITY_MAX_ENTRIES", 1024)
+"""记住的会话数量上限"""
+SESSION_AFFINITY_TTL: float = getattr(config, "SESSION_AFFINITY_TTL", 3600)
+"""会话记录的有效期（秒）"""
+
+HEALTH_CHECK_INTERVAL: float = getattr(config, "HEALTH_CHECK_INTERVAL", 30)
+"""检查空闲浏览器状态的间隔（秒），0 表示不启用检查和自动重启"""
+HEALTH_CHECK_TIMEOUT: float = getattr(config, "HEALTH_CHECK_TIMEOUT", 10)
+"""浏览器在这个时间内没有响应检查时视为卡死并重启（秒）"""
+LOGIN_CHECK_SCRIPT: Optional[str] = getattr(config, "LOGIN_CHECK_SCRIPT", None)
+"""在页面中执行，返回值为空时视为未登录；默认为 None，不检查登录状态（只用 cookie 的会话取不到 token）"""
+DRIVER_RETRIES: int = getattr(config, "DRIVER_RETRIES", 1)
+"""浏览器在处理请求时崩溃，请求重新排队的最多次数"""
+
+LIGHTWEIGHT_BROWSER: bool = getattr(config, "LIGHTWEIGHT_BROWSER", False)
+"""无头运行并屏蔽图片、媒体和网页字体、关闭动画、减少进程数和缓存；开启后总是使用复制的 profile"""
+LIGHTWEIGHT_PREFS: Dict[str, Any] = {
+    "permissions.default.image": 2,
+    "media.autoplay.default": 5,
+    "media.autoplay.blocking_policy": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "ui.prefersReducedMotion": 1,
+    "toolkit.cosmeticAnimations.enabled": False,
+    "image.animation_mode": "none",
+    "fission.autostart": False,
+    "dom.ipc.processCount": 1,
+    "dom.ipc.processCount.webIsolated": 1,
+    "browser.cache.disk.enable": False,
+    "browser.cache.memory.capacity": 16384,
+    "browser.sessionhistory.max_entries": 2,
+    "browser.sessionstore.resume_from_crash": False,
+    **getattr(config, "LIGHTWEIGHT_PREFS", {}),
+}
+"""轻量模式写入 profile 的 Firefox 设置，config 中的 LIGHTWEIGHT_PREFS 会覆盖或补充这些默认值"""
 
+RECYCLE_AFTER_REQUESTS: int = getattr(config, "RECYCLE_AFTER_REQUESTS", 0)
+"""浏览器处理这么多请求后重启，0 表示不限制"""
+RECYCLE_MAX_AGE: float = getattr(config, "RECYCLE_MAX_AGE", 0)
+"""浏览器运行超过这么多秒后重启，0 表示不限制"""
+RECYCLE_MAX_RSS_MB: float = getattr(config, "RECYCLE_MAX_RSS_MB", 0)
+"""浏览器全部进程的内存超过这么多 MB 后重启，需要 psutil，0 表示不限制"""
+PRUNE_CHATS: bool = getattr(config, "PRUNE_CHATS", False)
+"""在后台删除代理创建的上游会话"""
+PRUNE_CHATS_AFTER: float = getattr(config, "PRUNE_CHATS_AFTER", SESSION_AFFINITY_TTL if SESSION_AFFINITY else 0)
+"""会话最后一次使用多少秒后删除，默认与 SESSION_AFFINITY_TTL 相同，保证还能继续的会话不会被删除"""
+PRUNE_INTERVAL: float = getattr(config, "PRUNE_INTERVAL", 60)
+"""检查待删除会话的间隔（秒）"""
 
+CHAT_LIST_MAX_PAGES: int = getattr(config, "CHAT_LIST_MAX_PAGES", 5)
+"""同步会话列表时最多获取的页数"""
+CHAT_CORRELATION_WINDOW: float = getattr(config, "CHAT_CORRELATION_WINDOW", 30)
+"""无法从页面地址得到会话UUID时，在发送时间前后这么多秒内创建的会话中按消息内容查找（秒）"""
+CHAT_INDEX_MAX_ENTRIES: int = getattr(config, "CHAT_INDEX_MAX_ENTRIES", 4096)
+"""每个账号在内存中记录的会话数量上限"""
 
-request_queue = Queue()
-driver_lock = threading.Lock()
-processing_event = threading.Event()
+BATCH_DIR: str = getattr(config, "BATCH_DIR", "batches")
+"""批量任务的输入、结果和进度保存的目录，重启后从中断处继续"""
+BATCH_RATE: float = getattr(config, "BATCH_RATE", 0)
+"""批量任务每秒最多开始的请求数，0 表示只受 BATCH_CONCURRENCY 限制"""
+BATCH_CONCURRENCY: int = getattr(config, "BATCH_CONCURRENCY", POOL_SIZE * TABS_PER_DRIVER)
+"""批量任务同时处理的请求数上限，默认与浏览器池的容量相同"""
+BATCH_PRIORITY: str = getattr(config, "BATCH_PRIORITY", "low")
+"""批量请求的优先级名称，默认排在交互请求之后"""
+BATCH_REQUEST_TIMEOUT: float = getattr(config, "BATCH_REQUEST_TIMEOUT", REQUEST_TIMEOUT)
+"""批量任务中每个请求的超时时间（秒）"""
 
+HISTORY_CURSOR_LIMIT = 1024
+"""最多记住多少个会话的历史游标"""
 
-def init_driver():
+ChatHistoryTailCode = tail_history_script(ChatHistoryCode)
+
+CHAT_UUID_PATTERN = re.compile(r"([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/?$")
+
+
+request_queue = RequestQueue(MAX_QUEUE_DEPTH, MAX_QUEUE_WAIT)
+
+
+def init_driver(profile_path: str = PROFILE_PATH, headless: bool = LIGHTWEIGHT_BROWSER):
     options = webdriver.FirefoxOptions()
     options.binary_location = FIREFOX_BINARY
     options.add_argument("-profile")
-    options.add_argument(PROFILE_PATH)
+    options.add_argument(profile_path)
+    if headless:
+        options.add_argument("-headless")
     driver = webdriver.Firefox(options=options)
     driver.get(CHAT_URL)
     return driver
 
 
-driver = None
+def copy_profile(source: str, prefs: Optional[Dict[str, Any]] = None) -> str:
+    """复制 Firefox profile，跳过运行中实例留下的锁文件；prefs 写入副本的 user.js"""
+    target = tempfile.mkdtemp(prefix="chat2api-profile-")
+    shutil.copytree(
+        source,
+        target,
+        ignore=shutil.ignore_patterns("lock", ".parentlock", "parent.lock"),
+        dirs_exist_ok=True,
+    )
+    if prefs:
+        with open(os.path.join(target, "user.js"), "a", encoding="utf-8") as f:
+            for name, value in prefs.items():
+                f.write(f"user_pref({json.dumps(name)}, {json.dumps(value)});\n")
+    return target
+
 
+class BrowserWorker:
+    """
+    持有一个 WebDriver 及其工作线程，每个 worker 的状态互不共享
 
-def request_worker():
-    global driver
-    logger.info("Starting request worker thread")
+    打开多个标签页时每个标签页对应一个工作线程，线程只在发送消息和获取历史等短操作期间
+    持有 lock 并切换到自己的标签页，各标签页中的生成可以同时进行
+    """
     
-    while True:
+    def __init__(self, index: int, profile_path: str, temporary_profile: bool = False,
+                 source_profile: Optional[str] = None, tabs: int = 1):
+        self.index = index
+        self.profile_path = profile_path
+        self.temporary_profile = temporary_profile
+        self.source_profile = source_profile or profile_path
+        """复制前的 profile 路径，相同时表示登录的是同一个账号，可以访问彼此的会话"""
+        self.driver = None
+        self.http_session: Optional[HttpSession] = None
+        self.lock = threading.Lock()
+        """保护 driver，同一时刻只允许一个操作驱动浏览器"""
+        self.tab_count = tabs
+        self.tabs: List[str] = []
+        """各标签页的 window handle，下标为工作线程的编号"""
+        self._current_tab: Optional[str] = None
+        self._local = threading.local()
+        self._state_lock = threading.Lock()
+        self.inbox: Queue = Queue()
+        self.pending = 0
+        """已分配但尚未完成的请求数，包括调度器为下一个请求预留的位置"""
+        self.active = 0
+        """正在处理的请求数"""
+        self.processed = 0
+        self.started_at: Optional[float] = None
+        """当前浏览器的启动时间"""
+        self.served = 0
+        """当前浏览器处理过的请求数"""
+        self.healthy = True
+        """为 False 时不再分配新请求，等待 DriverSupervisor 恢复"""
+        self.recycling = False
+        """因 RECYCLE_* 停止接收请求、等待重启，重启后会自动恢复"""
+        self.threads = [
+            threading.Thread(
+                target=self.run, args=(slot,),
+                name=f"browser-worker-{index}" if tabs == 1 else f"browser-worker-{index}-{slot}",
+                daemon=True,
+            )
+            for slot in range(tabs)
+        ]
         
-        request = request_queue.get()
-        if request is None:  
-            break
-            
+    def ensure_driver(self):
+        if self.driver is None:
+            self.driver = init_driver(self.profile_path)
+            self.started_at = time.time()
+            self.served = 0
+            self.tabs = [self.driver.current_window_handle]
+            for _ in range(self.tab_count - 1):
+                self.driver.switch_to.new_window("tab")
+                self.driver.get(CHAT_URL)
+                self.tabs.append(self.driver.current_window_handle)
+            self._current_tab = self.tabs[-1]
+            logger.info(f"WebDriver {self.index} initialized with {self.tab_count} tab(s)")
+            if HTTP_BACKEND:
+                self.http_session = HttpSession(self.driver)
+        return self.driver
+
+    @contextmanager
+    def use_driver(self):
+        """持有 lock 并切换到当前工作线程的标签页"""
+        with self.lock:
+            driver = self.ensure_driver()
+            tab = self.tabs[getattr(self._local, "slot", 0)]
+            if tab != self._current_tab:
+                driver.switch_to.window(tab)
+                self._current_tab = tab
+            yield driver
+
+    def diagnose(self) -> Optional[str]:
+        """检查页面是否响应、输入框是否存在以及（设置了 LOGIN_CHECK_SCRIPT 时）是否已登录，返回发现的问题；需要持有 lock"""
+        driver = self.driver
+        if driver is None:
+            return None
+        if driver.execute_script("return document.readyState") is None:
+            return "page did not report its state"
+        if not driver.current_url.startswith(CHAT_URL):
+            driver.get(CHAT_URL)
+        if not driver.find_elements(By.ID, "chat-input"):
+            # 页面可能停在异常状态，重新加载一次再判断
+            driver.get(CHAT_URL)
+            if not driver.find_elements(By.ID, "chat-input"):
+                return "chat input not found"
+        if LOGIN_CHECK_SCRIPT and not driver.execute_script(LOGIN_CHECK_SCRIPT):
+            return "not logged in"
+        return None
+
+    def memory_usage(self) -> Optional[int]:
+        """浏览器全部进程的 RSS 之和（字节），没有 psutil 或无法读取时返回 None"""
+        if psutil is None or self.driver is None:
+            return None
         try:
+            service = psutil.Process(self.driver.service.process.pid)
+            return sum(child.memory_info().rss for child in service.children(recursive=True))
+        except (AttributeError, psutil.Error):
+            return None
+
+    def recycle_reason(self) -> Optional[str]:
+        """按 RECYCLE_* 策略判断浏览器是否需要重启"""
+        if self.driver is None:
+            return None
+        if RECYCLE_AFTER_REQUESTS and self.served >= RECYCLE_AFTER_REQUESTS:
+            return f"served {self.served} requests"
+        if RECYCLE_MAX_AGE and time.time() - self.started_at >= RECYCLE_MAX_AGE:
+            return f"running for {time.time() - self.started_at:.0f} seconds"
+        if RECYCLE_MAX_RSS_MB:
+            rss = self.memory_usage()
+            if rss is not None and rss >= RECYCLE_MAX_RSS_MB * 2**20:
+                return f"using {rss / 2**20:.0f} MB"
+        return None
+
+    def driver_alive(self) -> bool:
+        """浏览器进程和会话是否仍然可用"""
+        with self.lock:
+            if self.driver is None:
+                return False
+            try:
+                self.driver.current_url
+                return True
+            except Exception:
+                return False
+
+    def restart_driver(self):
+        """关闭当前浏览器并重新启动；需要持有 lock"""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logger.warning(f"Failed to quit WebDriver {self.index}: {e}")
+        self.driver = None
+        self.http_session = None
+        self.tabs = []
+        self._current_tab = None
+        self.ensure_driver()
             
-            result = process_request_by_mutation(request)
-            time.sleep(1)  
+    def run(self, slot: int = 0):
+        logger.info(f"Starting request worker thread {self.index} (tab {slot})")
+        self._local.slot = slot
             
-            request["result"] = result
-            request["exception"] = None
-        except Exception as e:
-            request["exception"] = e
-        finally:
+        while True:
+            
+            request = self.inbox.get()
+            if request is None:
+                break
             
-            request["event"].set()
+            started = time.time()
+            with self._state_lock:
+                self.active += 1
+            requeued = False
+            try:
+                check_request(request)
+                request["started_at"] = started
+                event_hub.emit_nowait(CHAT_STARTED, ChatStartedEvent(
+                    chat_start_time=started, proxy_uuid=request["id"], worker=self.index,
+                ))
             
-    logger.info("Request worker thread exiting")
+                if request["stream"]:
+                    result = process_request_streaming(self, request)
+                else:
+                    result = process_request_by_mutation(self, request)
+
+                request["result"] = result
+                request["exception"] = None
+                remember_chat(self, request, result)
+            except RequestCancelled as e:
+                logger.info(f"Request {request['id']} cancelled on worker {self.index}")
+                stop_generation(self)
+                request["exception"] = e
+            except Exception as e:
+                request["exception"] = e
+                if not self.driver_alive():
+                    pool.mark_unhealthy(self, f"driver failed while processing a request: {e}")
+                    requeued = requeue_request(self, request)
+            finally:
+                with self._state_lock:
+                    self.active -= 1
+                    self.processed += 1
+                    self.served += 1
+                request_queue.record_service_time(time.time() - started)
+                Metrics.WORKER_BUSY_SECONDS.labels(str(self.index)).inc(time.time() - started)
+                if not requeued:
+                    prune_later(self, request["chat_uuid"])
+                    finish_request(request)
+                    # 结果返回之后再随机等待，期间不释放这个 tab，下一个请求由其他 tab 处理或稍后开始
+                    jitter()
+                pool.release(self)
+                if pool.supervisor and (not self.healthy
+                                        or RECYCLE_AFTER_REQUESTS and self.served >= RECYCLE_AFTER_REQUESTS):
+                    pool.supervisor.wake()
 
+        logger.info(f"Request worker thread {self.index} exiting")
 
-worker_thread = threading.Thread(target=request_worker, daemon=True)
-worker_thread.start()
+    def close(self):
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+            self.tabs = []
+            logger.info(f"WebDriver {self.index} closed")
+        if self.temporary_profile:
+            shutil.rmtree(self.profile_path, ignore_errors=True)
 
-def create_and_get_chat_response(messages: List[ChatCompletionMessageParam]) -> ChatCompletion:
+
+class BrowserPool:
     """
-    线程安全的聊天响应创建方法
+    WebDriver 池，从共享的 request_queue 取请求并分配给最空闲的 worker
     """
-    
-    request = {
+
+    def __init__(self, size: int, capacity: int = 1):
+        self.capacity = capacity
+        """每个 worker 同时处理的请求上限"""
+        self.workers: List[BrowserWorker] = []
+        self._available = threading.Condition()
+        self._closing = False
+
+        for index in range(size):
+            source = PROFILE_PATHS[index] if PROFILE_PATHS else PROFILE_PATH
+            if LIGHTWEIGHT_BROWSER or (not PROFILE_PATHS and size > 1):
+                profile = copy_profile(source, LIGHTWEIGHT_PREFS if LIGHTWEIGHT_BROWSER else None)
+                self.workers.append(BrowserWorker(index, profile, temporary_profile=True,
+                                                   source_profile=source, tabs=capacity))
+            else:
+                self.workers.append(BrowserWorker(index, source, tabs=capacity))
+
+        request_queue.capacity = size * capacity
+        self.dispatcher_thread = threading.Thread(
+            target=self.dispatch, name="browser-dispatcher", daemon=True
+        )
+        self.supervisor = DriverSupervisor(self, HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT) if HEALTH_CHECK_INTERVAL else None
+
+    def start(self):
+        for worker in self.workers:
+            for thread in worker.threads:
+                thread.start()
+        self.dispatcher_thread.start()
+        if self.supervisor:
+            self.supervisor.start()
+
+    def acquire(self) -> Optional[BrowserWorker]:
+        """
+        等待并返回负载最低且仍有空位的 worker，关闭时返回 None；
+        等待期间每秒结束一次队列中已取消或超过截止时间的请求
+        """
+        with self._available:
+            while not self._closing:
+                candidates = [w for w in self.workers if w.healthy and w.pending < self.capacity]
+                if candidates:
+                    worker = min(candidates, key=lambda w: (w.pending, w.processed))
+                    worker.pending += 1
+                    return worker
+                if not self._available.wait(1):
+                    expire_queued_requests()
+        return None
+
+    def release(self, worker: BrowserWorker):
+        with self._available:
+            worker.pending -= 1
+            self._available.notify()
+
+    def mark_unhealthy(self, worker: BrowserWorker, reason: str):
+        """停止向 worker 分配请求，直到 supervisor 确认其恢复"""
+        if worker.healthy:
+            logger.warning(f"Worker {worker.index} marked unhealthy: {reason}")
+        worker.healthy = False
+
+    def mark_healthy(self, worker: BrowserWorker):
+        with self._available:
+            if not worker.healthy:
+                logger.info(f"Worker {worker.index} is healthy again")
+            worker.healthy = True
+            worker.recycling = False
+            self._available.notify_all()
+
+    def dispatch(self):
+        while True:
+            # 先等到有空闲 worker 再出队，让排队中的高优先级请求可以插到前面
+            worker = self.acquire()
+            if worker is None:
+                break
+            request = request_queue.get()
+            if request is None:
+                self.release(worker)
+                break
+            if not worker.healthy:
+                # 预留位置之后 worker 被标记为不可用，请求放回队列等待其他 worker
+                self.release(worker)
+                request_queue.requeue(request, request["priority"])
+                continue
+            if request_queue.waited_too_long(request):
+                self.release(worker)
+                request["exception"] = QueueWaitTimeout(
+                    f"Request waited more than {request_queue.max_wait} seconds in queue",
+                    request_queue.retry_after(),
+                )
+                finish_request(request)
+                continue
+            try:
+                check_request(request)
+            except (RequestCancelled, TimeoutError) as e:
+                logger.info(f"Dropping request {request['id']} before dispatch: {e}")
+                self.release(worker)
+                request["exception"] = e
+                finish_request(request)
+                continue
+            Metrics.observe_stage("queue_wait", time.time() - request["enqueued_at"])
+            logger.info(f"Dispatching request {request['id']} to worker {worker.index}")
+            worker.inbox.put(request)
+
+        for worker in self.workers:
+            for _ in worker.threads:
+                worker.inbox.put(None)
+
+    def busy_count(self) -> int:
+        return sum(1 for w in self.workers if w.active > 0)
+
+    def healthy_count(self) -> int:
+        return sum(1 for w in self.workers if w.healthy)
+
+    def accepting_requests(self) -> bool:
+        """是否有 worker 可以处理或即将恢复处理请求（正在回收重启的也算）"""
+        return any(w.healthy or w.recycling for w in self.workers)
+
+    def shutdown(self):
+        if self.supervisor:
+            self.supervisor.stop()
+        with self._available:
+            self._closing = True
+            self._available.notify_all()
+        request_queue.put_sentinel()
+        self.dispatcher_thread.join()
+        for worker in self.workers:
+            for thread in worker.threads:
+                thread.join()
+            worker.close()
+
+
+class DriverSupervisor:
+    """
+    定期检查空闲 worker 的浏览器，卡死、崩溃或页面异常时在后台重启；
+    未登录时只停止分配请求，等待人工处理后自动恢复。
+
+    达到 RECYCLE_* 条件的浏览器先停止接收新请求，处理完手头的请求后重启
+    """
+
+    def __init__(self, pool: BrowserPool, interval: float, timeout: float):
+        self.pool = pool
+        self.interval = interval
+        self.timeout = timeout
+        self._wake = threading.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=len(pool.workers), thread_name_prefix="driver-health")
+        self.thread = threading.Thread(target=self.run, name="driver-supervisor", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self.thread.join()
+        self._executor.shutdown(wait=False)
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped:
+                break
+            for worker in self.pool.workers:
+                try:
+                    self.check(worker)
+                except Exception:
+                    logger.exception(f"Health check of worker {worker.index} failed")
+
+    def check(self, worker: BrowserWorker):
+        """只检查没有在处理请求的 worker，检查期间持有它的 lock"""
+        recycle = worker.recycle_reason()
+        if recycle:
+            worker.recycling = True
+            self.pool.mark_unhealthy(worker, f"recycling, {recycle}")
+        if worker.active or not worker.lock.acquire(blocking=False):
+            return
+        try:
+            if worker.active:
+                return
+            if recycle:
+                self.restart(worker, recycle, "recycle")
+                return
+            future = self._executor.submit(worker.diagnose)
+            try:
+                problem = future.result(self.timeout)
+            except FutureTimeoutError:
+                problem = "unresponsive"
+            except Exception as e:
+                problem = f"crashed: {e}"
+
+            if problem is None:
+                self.pool.mark_healthy(worker)
+            elif problem == "not logged in":
+                self.pool.mark_unhealthy(worker, "the browser profile is not logged in")
+            else:
+                self.pool.mark_unhealthy(worker, problem)
+                self.restart(worker, problem, "failure")
+        finally:
+            worker.lock.release()
+
+    def restart(self, worker: BrowserWorker, reason: str, kind: str):
+        logger.warning(f"Restarting WebDriver {worker.index}: {reason}")
+        Metrics.DRIVER_RESTARTS.labels(str(worker.index), kind).inc()
+        try:
+            worker.restart_driver()
+        except Exception:
+            logger.exception(f"Failed to restart WebDriver {worker.index}, will retry")
+            return
+        self.pool.mark_healthy(worker)
+
+
+if PROFILE_PATHS and len(PROFILE_PATHS) < POOL_SIZE:
+    raise ValueError("PROFILE_PATHS must provide a profile for every pool slot")
+
+pool = BrowserPool(POOL_SIZE, TABS_PER_DRIVER)
+pool.start()
+
+Metrics.QUEUE_DEPTH.set_function(request_queue.qsize)
+Metrics.WORKERS.set_function(lambda: len(pool.workers))
+Metrics.WORKERS_BUSY.set_function(pool.busy_count)
+Metrics.WORKERS_HEALTHY.set_function(pool.healthy_count)
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_PATH) if CACHE_ENABLED else None
+
+inflight: Dict[str, Dict[str, Any]] = {}
+"""按请求内容索引的、已入队但尚未完成的请求"""
+inflight_lock = threading.Lock()
+
+history_cursors: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+"""每个会话上次看到的最后一条消息：message_id、长度和状态"""
+history_cursors_lock = threading.Lock()
+
+session_affinity = SessionAffinity(SESSION_AFFINITY_MAX_ENTRIES, SESSION_AFFINITY_TTL) if SESSION_AFFINITY else None
+
+chat_indexes: Dict[str, ChatSessionIndex] = {}
+"""账号（源 profile）-> 该账号下已知的上游会话"""
+chat_indexes_lock = threading.Lock()
+
+def chat_index(worker: BrowserWorker) -> ChatSessionIndex:
+    with chat_indexes_lock:
+        index = chat_indexes.get(worker.source_profile)
+        if index is None:
+            index = chat_indexes[worker.source_profile] = ChatSessionIndex(CHAT_INDEX_MAX_ENTRIES)
+        return index
+
+pruner_sessions: Dict[str, HttpSession] = {}
+"""未开启 HTTP_BACKEND 时删除会话使用的凭据，每个账号（源 profile）一份"""
+
+def delete_upstream_chat(chat_uuid: str, account: str):
+    """通过 HTTP 接口删除上游会话，凭据取自同一账号下一个已经启动的浏览器"""
+    worker = next((w for w in pool.workers if w.source_profile == account and w.driver is not None and w.healthy), None)
+    if worker is None:
+        raise RuntimeError(f"no running browser for account {account} to take credentials from")
+
+    if worker.http_session:
+        fetch_via_http(worker, lambda session: session.delete_chat(chat_uuid))
+    else:
+        session = pruner_sessions.get(account)
+        if session is None:
+            with worker.use_driver() as driver:
+                session = pruner_sessions[account] = HttpSession(driver)
+        try:
+            session.delete_chat(chat_uuid)
+        except HttpSessionExpired:
+            with worker.use_driver() as driver:
+                session.harvest(driver)
+            session.delete_chat(chat_uuid)
+
+    with history_cursors_lock:
+        history_cursors.pop(chat_uuid, None)
+    with chat_indexes_lock:
+        index = chat_indexes.get(account)
+    if index:
+        index.forget(chat_uuid)
+    Metrics.PRUNED_CHATS.inc()
+
+chat_pruner = ChatPruner(delete_upstream_chat, PRUNE_CHATS_AFTER, PRUNE_INTERVAL) if PRUNE_CHATS else None
+if chat_pruner:
+    chat_pruner.start()
+
+def prune_later(worker: BrowserWorker, chat_uuid: Optional[str]):
+    """把 worker 的账号下的会话交给 chat_pruner，在最后一次使用一段时间后删除"""
+    if chat_pruner and chat_uuid:
+        chat_pruner.track(chat_uuid, worker.source_profile)
+
+def resolve_priority(api_key: Optional[str] = None, requested: Optional[str] = None) -> int:
+    """根据 API key 或请求指定的优先级名称得到队列优先级"""
+    name = API_KEY_PRIORITIES.get(api_key) or requested or DEFAULT_PRIORITY
+    return PRIORITY_CLASSES.get(name, PRIORITY_CLASSES.get(DEFAULT_PRIORITY, 0))
+
+def new_request(messages: List[ChatCompletionMessageParam],
+                timeout: Optional[float] = None,
+                use_cache: bool = True,
+                params: Optional[Dict[str, Any]] = None,
+                priority: Optional[int] = None) -> Dict[str, Any]:
+    """
+    创建进入队列的请求，timeout 为从现在起的截止时间（秒），
+    params 为参与缓存键计算的请求参数，use_cache 为 False 时既不使用缓存也不与相同请求合并，
+    priority 为队列优先级，见 resolve_priority
+    """
+    key = cache_key(messages, params) if use_cache and (response_cache or COALESCE_REQUESTS) else None
+    return {
         "id": str(uuid.uuid4()),
         "messages": messages,
+        "cache_key": key if response_cache else None,
+        "dedup_key": key if COALESCE_REQUESTS else None,
+        "priority": resolve_priority() if priority is None else priority,
+        "cancelled": threading.Event(),
+        "waiters": 1,
+        "started_at": None,
+        "sent_at": None,
+        "first_token_at": None,
+        "deadline": time.time() + (timeout or REQUEST_TIMEOUT),
         "event": threading.Event(),
+        "callbacks": [],
+        "stream": False,
+        "delta_callbacks": [],
+        "partial": None,
+        "attempts": 0,
+        "chat_uuid": None,
+        "chat_url": None,
+        "after_message_id": None,
         "result": None,
         "exception": None
     }
+
+def enqueue_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把请求放入队列；相同请求已在处理中时改为挂到该请求上，返回实际承载结果的请求。
+    队列已满时抛出 QueueFullError，没有可用的浏览器时抛出 NoHealthyWorkers
+    """
+    key = request["dedup_key"]
+    with inflight_lock:
+        leader = inflight.get(key) if key else None
+        if leader is None:
+            logger.info(f"Adding request {request['id']} to queue")
+            try:
+                if not pool.accepting_requests():
+                    raise NoHealthyWorkers("No healthy browser is available", HEALTH_CHECK_INTERVAL or SEND_TIMEOUT)
+                request_queue.put(request, request["priority"])
+            except AdmissionError as e:
+                Metrics.REQUESTS.labels("rejected").inc()
+                event_hub.emit_nowait(CHAT_FAILED, ChatFailedEvent(
+                    uuid=None, proxy_uuid=request["id"], outcome="rejected", error=str(e),
+                ))
+                raise
+            if key:
+                inflight[key] = request
+            event_hub.emit_nowait(REQUEST_QUEUED, RequestQueuedEvent(
+                proxy_uuid=request["id"], priority=request["priority"], queued_at=request["enqueued_at"],
+            ))
+            return request
+        else:
+            if request["stream"]:
+                leader["stream"] = True
+                partial = leader["partial"]
+                if partial:
+                    replay = convert_to_chat_completion_chunk(
+                        partial["id"],
+                        partial["created"],
+                        content=partial["content"],
+                        reasoning_content=partial["reasoning_content"],
+                        role="assistant",
+                    )
+                    for callback in request["delta_callbacks"]:
+                        callback(replay)
+            leader["delta_callbacks"].extend(request["delta_callbacks"])
+            leader["callbacks"].extend(request["callbacks"])
+            leader["waiters"] += 1
+            Metrics.COALESCED_REQUESTS.inc()
+            logger.info(f"Request {request['id']} joined in-flight request {leader['id']}")
+            return leader
+
+def expire_queued_requests():
+    """结束队列中已取消或超过截止时间的请求，没有空闲 worker 时由调度器定期调用"""
+    now = time.time()
+    for request in request_queue.remove(lambda r: r["cancelled"].is_set() or now >= r["deadline"]):
+        try:
+            check_request(request)
+        except (RequestCancelled, TimeoutError) as e:
+            logger.info(f"Dropping request {request['id']} while waiting for a worker: {e}")
+            request["exception"] = e
+        finish_request(request)
+
+def requeue_request(worker: BrowserWorker, request: Dict[str, Any]) -> bool:
+    """
+    浏览器在处理请求时失效，把还没有向客户端输出内容的请求放回队列由其他 worker 处理，
+    返回是否已重新排队
+    """
+    if (request["attempts"] >= DRIVER_RETRIES or request["partial"] is not None
+            or request["cancelled"].is_set() or time.time() >= request["deadline"]):
+        return False
+    request["attempts"] += 1
+    prune_later(worker, request["chat_uuid"])
+    request["started_at"] = None
+    request["sent_at"] = None
+    request["first_token_at"] = None
+    request["chat_uuid"] = None
+    request["chat_url"] = None
+    request["after_message_id"] = None
+    request_queue.requeue(request, request["priority"])
+    Metrics.REQUEUED_REQUESTS.inc()
+    logger.info(f"Request {request['id']} requeued after a driver failure (attempt {request['attempts']})")
+    return True
+
+def cancel_request(request: Dict[str, Any]):
+    """
+    某个等待方放弃请求；所有等待方都放弃后标记取消，
+    尚未开始的请求会被跳过，已开始的请求会停止生成
+    """
+    with inflight_lock:
+        request["waiters"] -= 1
+        if request["waiters"] > 0 or request["event"].is_set():
+            return
+        request["cancelled"].set()
+        if inflight.get(request["dedup_key"]) is request:
+            del inflight[request["dedup_key"]]
+    logger.info(f"Request {request['id']} cancelled by client")
+
+def check_request(request: Dict[str, Any]):
+    """请求已取消或超过截止时间时抛出异常"""
+    if request["cancelled"].is_set():
+        raise RequestCancelled(f"Request {request['id']} was cancelled")
+    if time.time() >= request["deadline"]:
+        raise TimeoutError(f"Request {request['id']} passed its deadline")
+
+def time_left(request: Dict[str, Any], limit: float) -> float:
+    """本次等待可用的时间，不超过 limit 和请求剩余时间"""
+    check_request(request)
+    return min(limit, request["deadline"] - time.time())
+
+def request_outcome(request: Dict[str, Any]) -> str:
+    exception = request["exception"]
+    if exception is None:
+        return "success"
+    if isinstance(exception, RequestCancelled):
+        return "cancelled"
+    if isinstance(exception, AdmissionError):
+        return "rejected"
+    if isinstance(exception, TimeoutError):
+        return "timeout"
+    return "error"
+
+def finish_request(request: Dict[str, Any]):
+    """在 worker 线程中标记请求完成并通知所有等待方"""
+    Metrics.REQUESTS.labels(request_outcome(request)).inc()
+    with inflight_lock:
+        if inflight.get(request["dedup_key"]) is request:
+            del inflight[request["dedup_key"]]
+    if request["cache_key"] and not request["exception"]:
+        response_cache.put(request["cache_key"], request["result"])
+    if request["exception"] is None:
+        event_hub.emit_nowait(CHAT_FINISHED, ChatFinishedEvent(
+            uuid=request["chat_uuid"], proxy_uuid=request["id"], duration=time.time() - request["enqueued_at"],
+        ))
+    else:
+        event_hub.emit_nowait(CHAT_FAILED, ChatFailedEvent(
+            uuid=request["chat_uuid"], proxy_uuid=request["id"], outcome=request_outcome(request),
+            error=str(request["exception"]),
+        ))
+    request["event"].set()
+    for callback in request["callbacks"]:
+        try:
+            callback(request)
+        except Exception:
+            logger.exception(f"Completion callback failed for request {request['id']}")
+
+def emit_delta(request: Dict[str, Any], chunk: ChatCompletionChunk):
+    """在 worker 线程中把增量推送给流式订阅者，并记录已生成的内容供后加入的订阅者补发"""
+    with inflight_lock:
+        delta = chunk.choices[0].delta
+        partial = request["partial"]
+        if partial is None:
+            partial = request["partial"] = {
+                "id": chunk.id, "created": chunk.created, "content": "", "reasoning_content": ""
+            }
+        partial["content"] += delta.content or ""
+        partial["reasoning_content"] += getattr(delta, "reasoning_content", None) or ""
+
+        for callback in request["delta_callbacks"]:
+            try:
+                callback(chunk)
+            except Exception:
+                logger.exception(f"Delta callback failed for request {request['id']}")
+
+    if event_hub.has_listeners(CHAT_DELTA) and (delta.content or getattr(delta, "reasoning_content", None)):
+        event_hub.emit_nowait(CHAT_DELTA, ChatDeltaEvent(
+            uuid=request["chat_uuid"], proxy_uuid=request["id"], content=delta.content or "",
+            reasoning_content=getattr(delta, "reasoning_content", None) or "",
+        ))
+
+def set_chat_uuid(worker: BrowserWorker, request: Dict[str, Any], chat_uuid: str, chat_url: Optional[str],
+                  continued: bool = False):
+    """记录请求所在的上游会话并发布 CHAT_GENERATING 事件"""
+    request["chat_uuid"] = chat_uuid
+    request["chat_url"] = chat_url
+    chat_index(worker).record(chat_uuid, request["sent_at"] or time.time(), claimed_by=request["id"])
+    if not continued:
+        Metrics.observe_stage("chat_uuid", time.time() - request["sent_at"])
+    event_hub.emit_nowait(CHAT_GENERATING, ChatGeneratingEvent(
+        uuid=chat_uuid,
+        proxy_uuid=request["id"],
+        chat_start_time=request["started_at"] or request["sent_at"],
+        chat_url=chat_url,
+        sent_at=request["sent_at"],
+        continued=continued,
+    ))
+
+def log_chat_generating(event: ChatGeneratingEvent):
+    if not event["continued"]:
+        logger.info(f"Chat generating started for request {event['proxy_uuid']}, UUID: {event['uuid']}")
+
+event_hub.on(CHAT_GENERATING, log_chat_generating)
+
+def _resolve_future(future: asyncio.Future, request: Dict[str, Any]):
+    if future.done():
+        return
+    if request["exception"]:
+        future.set_exception(request["exception"])
+    else:
+        future.set_result(request["result"])
+
+def cached_response(request: Dict[str, Any]) -> Optional[ChatCompletion]:
+    if not request["cache_key"]:
+        return None
+    cached = response_cache.get(request["cache_key"])
+    Metrics.CACHE_REQUESTS.labels("hit" if cached else "miss").inc()
+    if cached:
+        logger.info(f"Request {request['id']} answered from cache")
+    return cached
+
+def create_and_get_chat_response(messages: List[ChatCompletionMessageParam],
+                                 timeout: Optional[float] = None,
+                                 use_cache: bool = True,
+                                 params: Optional[Dict[str, Any]] = None,
+                                 priority: Optional[int] = None,
+                                 stop: Optional[threading.Event] = None) -> ChatCompletion:
+    """
+    线程安全的聊天响应创建方法；stop 被设置时放弃等待并取消请求，抛出 RequestCancelled
+    """
     
-    logger.info(f"Adding request {request['id']} to queue")
-    
-    
-    request_queue.put(request)
+    request = new_request(messages, timeout, use_cache, params, priority)
+    cached = cached_response(request)
+    if cached:
+        return cached
     
+    request = enqueue_request(request)
     
-    request["event"].wait()
+    if stop is None:
+        request["event"].wait()
+    else:
+        while not request["event"].wait(1):
+            if stop.is_set():
+                cancel_request(request)
+                raise RequestCancelled(f"Request {request['id']} was cancelled")
     
     
     if request["exception"]:
@@ -108,163 +995,540 @@ def create_and_get_chat_response(messages: List[ChatCompletionMessageParam]) ->
     
     return request["result"]
 
-def process_request(request: Dict[str, Any]) -> ChatCompletion:
+def submit_chat_request(messages: List[ChatCompletionMessageParam],
+                        timeout: Optional[float] = None,
+                        use_cache: bool = True,
+                        params: Optional[Dict[str, Any]] = None,
+                        priority: Optional[int] = None) -> asyncio.Future:
+    """
+    在事件循环中提交请求，返回由 worker 线程通过 call_soon_threadsafe 完成的 future
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    request = new_request(messages, timeout, use_cache, params, priority)
+    cached = cached_response(request)
+    if cached:
+        future.set_result(cached)
+        return future
+    request["callbacks"].append(
+        lambda r: loop.call_soon_threadsafe(_resolve_future, future, r)
+    )
+
+    request = enqueue_request(request)
+    future.add_done_callback(lambda f: cancel_request(request) if f.cancelled() else None)
+    return future
+
+async def acreate_and_get_chat_response(messages: List[ChatCompletionMessageParam],
+                                        timeout: Optional[float] = None,
+                                        use_cache: bool = True,
+                                        params: Optional[Dict[str, Any]] = None,
+                                        priority: Optional[int] = None) -> ChatCompletion:
+    """
+    create_and_get_chat_response 的异步版本，等待期间不阻塞事件循环
+    """
+    return await submit_chat_request(messages, timeout, use_cache, params, priority)
+
+def astream_chat_response(messages: List[ChatCompletionMessageParam],
+                          timeout: Optional[float] = None,
+                          use_cache: bool = True,
+                          params: Optional[Dict[str, Any]] = None,
+                          priority: Optional[int] = None) -> AsyncGenerator[ChatCompletionChunk, None]:
+    """
+    流式获取回复。请求在调用时立即入队，过载时直接抛出 QueueFullError；
+    返回的异步生成器在生成过程中逐块产出 ChatCompletionChunk
+    """
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+    request = new_request(messages, timeout, use_cache, params, priority)
+    cached = cached_response(request)
+    if cached:
+        return _replay_chunks(cached)
+    request["stream"] = True
+    request["delta_callbacks"].append(
+        lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+    )
+    request["callbacks"].append(
+        lambda r: loop.call_soon_threadsafe(chunks.put_nowait, None)
+    )
+
+    return _consume_chunks(enqueue_request(request), chunks)
+
+async def _replay_chunks(completion: ChatCompletion) -> AsyncGenerator[ChatCompletionChunk, None]:
+    for chunk in convert_completion_to_chunks(completion):
+        yield chunk
+
+async def _consume_chunks(request: Dict[str, Any], chunks: asyncio.Queue) -> AsyncGenerator[ChatCompletionChunk, None]:
+    streamed = False
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            streamed = True
+            yield chunk
+    finally:
+        # 客户端断开时生成器被关闭或取消
+        if not request["event"].is_set():
+            cancel_request(request)
+
+    if request["exception"]:
+        raise request["exception"]
+    if not streamed:
+        # 合并到了已经按非流式处理的请求上，只能一次性返回完整结果
+        for chunk in convert_completion_to_chunks(request["result"]):
+            yield chunk
+
+def process_request(worker: BrowserWorker, request: Dict[str, Any]) -> ChatCompletion:
     """
     处理单个聊天请求
     """
-    global driver
     
+    chat_uuid = continue_chat(worker, request)
+    if chat_uuid:
+        return poll_for_chat_completion(worker, chat_uuid, request)
     
-    with driver_lock:
-        
-        if driver is None:
-            driver = init_driver()
-            logger.info("WebDriver initialized")
+    with worker.use_driver() as driver:
         
         
         chat_start_time = time.time()
         
         
-        send_chat_message(request["messages"])
-        
+        send_chat_message(driver, request["messages"], request)
         
-        chat_uuid = get_chat_uuid_by_create_time(chat_start_time)
-        if not chat_uuid:
-            raise Exception("Failed to get chat UUID")
         
-        logger.info(f"Chat generating started, UUID: {chat_uuid}")
+        chat_uuid = wait_for_chat_uuid(driver, time_left(request, SEND_TIMEOUT))
+        chat_url = driver.current_url if chat_uuid else None
         
         
-        return poll_for_chat_completion(chat_uuid, chat_start_time)
-
-def process_request_by_mutation(request: Dict[str, Any]) -> ChatCompletion:
-    global driver
+    if not chat_uuid:
+        chat_uuid = find_chat_uuid(worker, request, chat_start_time)
+    if not chat_uuid:
+        raise Exception("Failed to get chat UUID")
     
+    set_chat_uuid(worker, request, chat_uuid, chat_url)
     
-    with driver_lock:
-        
-        if driver is None:
-            driver = init_driver()
-            logger.info("WebDriver initialized")
+    
+    return poll_for_chat_completion(worker, chat_uuid, request)
 
-        
-        send_chat_message(request["messages"])
+def process_request_by_mutation(worker: BrowserWorker, request: Dict[str, Any]) -> ChatCompletion:
 
-        for i in range(2):
+    chat_uuid = continue_chat(worker, request)
+    if chat_uuid:
+        return poll_for_chat_completion(worker, chat_uuid, request)
+
+    if worker.tab_count > 1:
+        # 异步脚本会占住整个 WebDriver 会话，多标签页时改为等待页面跳转
+        chat_uuid = start_chat_by_navigation(worker, request)
+        return poll_for_chat_completion(worker, chat_uuid, request)
+
+    chat_start_time = time.time()
+    with worker.use_driver() as driver:
+    
+    
+        send_chat_message(driver, request["messages"], request)
+
+        driver.set_script_timeout(time_left(request, REQUEST_TIMEOUT))
+        try:
             chat_path = driver.execute_async_script(ChatMutationCode)
-            """
-            pathname like /chat/xxxx-xxxx-xxxx-xxxx
-            """
+        finally:
+            driver.set_script_timeout(SCRIPT_TIMEOUT)
+        """
+        pathname like /chat/xxxx-xxxx-xxxx-xxxx
+        """
 
-            chat_uuid = chat_path.split("/")[-1] if chat_path else None
+        chat_uuid = chat_path.split("/")[-1] if chat_path else None
 
-            if not chat_uuid:
-                raise Exception("Failed to get chat UUID from mutation")
-            
-            logger.info(f"Chat generating started via mutation, UUID: {chat_uuid}")
+    if chat_uuid:
+        set_chat_uuid(worker, request, chat_uuid, urljoin(CHAT_URL, chat_path))
+    else:
+        chat_uuid = find_chat_uuid(worker, request, chat_start_time)
+        if not chat_uuid:
+            raise Exception("Failed to get chat UUID from mutation")
+        set_chat_uuid(worker, request, chat_uuid, None)
 
-            chat_history = get_chat_history(chat_uuid)
-            if not chat_history:
-                continue
+    return poll_for_chat_completion(worker, chat_uuid, request)
 
-            return convert_to_chat_completion(chat_uuid, chat_history)
-        raise Exception("Failed to get chat history after mutation")
 
 
 
 
 
+def process_request_streaming(worker: BrowserWorker, request: Dict[str, Any]) -> ChatCompletion:
+    """
+    处理流式请求，生成期间持续推送增量
+    """
+
+    chat_uuid = continue_chat(worker, request) or start_chat_by_navigation(worker, request)
+
+    return stream_chat_completion(worker, request, chat_uuid)
+
+def start_chat_by_navigation(worker: BrowserWorker, request: Dict[str, Any]) -> str:
+    """在新会话中发送消息，通过页面跳转得到会话UUID，页面没有跳转时从会话列表中查找"""
+
+    chat_start_time = time.time()
+    with worker.use_driver() as driver:
+
+        send_chat_message(driver, request["messages"], request)
 
-def send_chat_message(messages: List[ChatCompletionMessageParam]):
-    """发送消息到聊天界面"""
+    chat_uuid, chat_url = wait_for_chat_url(worker, time_left(request, SEND_TIMEOUT))
+
+    if not chat_uuid:
+        chat_uuid = find_chat_uuid(worker, request, chat_start_time)
+    if not chat_uuid:
+        raise Exception("Failed to get chat UUID from navigation")
+    set_chat_uuid(worker, request, chat_uuid, chat_url)
+    return chat_uuid
+
+def format_input(messages: List[ChatCompletionMessageParam]) -> str:
+    """写入输入框的内容"""
+    return "\n".join([msg["content"] for msg in messages])
+
+def normalize_input(text: str) -> str:
+    """忽略空白差异，用于比较页面上的消息与发送的内容"""
+    return " ".join(text.split())
+
+def send_chat_message(driver, messages: List[ChatCompletionMessageParam], request: Optional[Dict[str, Any]] = None,
+                      chat_url: str = CHAT_URL):
+    """
+    发送消息到聊天界面，传入 request 时各步骤的等待不超过其截止时间，并记录发送完成的时间；
+    chat_url 为已有会话的地址时在该会话中继续对话
+    """
+    wait_limit = (lambda: time_left(request, SEND_TIMEOUT)) if request else (lambda: SEND_TIMEOUT)
+    input_started = time.time()
     
-    if driver.current_url != CHAT_URL:
-        driver.get(CHAT_URL)
+    if driver.current_url != chat_url:
+        driver.get(chat_url)
     
     
-    WebDriverWait(driver, 10).until(
-        expected_conditions.presence_of_element_located((By.ID, "chat-input"))
+    WebDriverWait(driver, wait_limit()).until(
+        expected_conditions.element_to_be_clickable((By.ID, "chat-input"))
     )
     
     
     input_box = driver.find_element(By.ID, "chat-input")
-    input_text = "\n".join([msg["content"] for msg in messages])
+    input_text = format_input(messages)
     
     
-    input_box.send_keys(input_text)
+    fill_input(driver, input_box, input_text)
+    jitter()
     input_box.send_keys(Keys.RETURN)
     
     
-    time.sleep(3 + random.random())
-
-def get_chat_uuid_by_create_time(chat_create_time: float) -> Optional[str]:
-    """根据创建时间查找聊天会话UUID"""
-    
-    if not driver.current_url.startswith(CHAT_URL):
-        driver.get(CHAT_URL)
-    
-    
-    chat_list = driver.execute_async_script(ChatListCode)
-    
-    
-    from ChatListResponse import Response
-    response = Response(chat_list)
-    
-    
-    for chat in response.data.biz_data.chat_sessions:
-        if abs(chat_create_time - chat.inserted_at) < 5:
-            return chat.id
+    try:
+        WebDriverWait(driver, wait_limit(), poll_frequency=0.1).until(
+            lambda d: message_sent(d, input_box, chat_url)
+        )
+    except TimeoutException:
+        logger.warning("Page did not confirm that the message was sent")
     
-    logger.warning(f"No chat session found near timestamp {chat_create_time}")
+    Metrics.observe_stage("input", time.time() - input_started)
+    if request:
+        request["sent_at"] = time.time()
+
+def continue_chat(worker: BrowserWorker, request: Dict[str, Any]) -> Optional[str]:
+    """
+    请求的对话前缀命中之前的会话时，回到该会话只发送新的消息并返回会话UUID；
+    未命中或无法打开该会话时返回 None，由调用方新建会话
+    """
+    if session_affinity is None:
+        return None
+    session = session_affinity.take(request["messages"], worker.source_profile)
+    if session is None:
+        return None
+    prune_later(worker, session["chat_uuid"])
+
+    with worker.use_driver() as driver:
+        try:
+            send_chat_message(driver, session["messages"], request, session["chat_url"])
+        except TimeoutException:
+            logger.warning(f"Could not reopen chat {session['chat_uuid']}, starting a new one")
+            return None
+
+    request["after_message_id"] = session["message_id"]
+    set_chat_uuid(worker, request, session["chat_uuid"], session["chat_url"], continued=True)
+    Metrics.CONTINUED_REQUESTS.inc()
+    logger.info(f"Continuing chat {session['chat_uuid']} after message {session['message_id']}")
+    return session["chat_uuid"]
+
+def remember_chat(worker: BrowserWorker, request: Dict[str, Any], completion: ChatCompletion):
+    """记录这段对话所在的会话，供带着这次回复继续提问的请求使用"""
+    if session_affinity is None or not request["chat_url"]:
+        return
+    cursor = get_history_cursor(request["chat_uuid"])
+    if cursor is None or cursor["status"] != "FINISHED":
+        return
+    session_affinity.remember(
+        request["messages"],
+        completion.choices[0].message.content or "",
+        request["chat_uuid"],
+        request["chat_url"],
+        cursor["message_id"],
+        worker.source_profile,
+    )
+
+def stop_generation(worker: BrowserWorker):
+    """点击页面的停止按钮，结束已取消请求的生成"""
+    if not STOP_BUTTON_SELECTOR or worker.driver is None:
+        return
+    with worker.use_driver() as driver:
+        try:
+            driver.find_element(By.CSS_SELECTOR, STOP_BUTTON_SELECTOR).click()
+        except WebDriverException as e:
+            logger.warning(f"Failed to stop generation on worker {worker.index}: {e}")
+
+def fill_input(driver, input_box, text: str):
+    """写入输入框，优先使用脚本批量写入，失败时退回 send_keys"""
+    if BULK_INPUT:
+        try:
+            if driver.execute_script(SetInputValueCode, input_box, text):
+                return
+            logger.warning("Bulk input was rejected by the page, falling back to send_keys")
+        except WebDriverException as e:
+            logger.warning(f"Bulk input failed, falling back to send_keys: {e}")
+        input_box.clear()
+
+    input_box.send_keys(text)
+
+def message_sent(driver, input_box, start_url: str = CHAT_URL) -> bool:
+    """输入框被清空、被重新渲染或页面从 start_url 跳转到会话页时视为消息已发出"""
+    if driver.current_url != start_url and CHAT_UUID_PATTERN.search(driver.current_url):
+        return True
+    try:
+        return not input_box.get_attribute("value")
+    except StaleElementReferenceException:
+        return True
+
+def jitter():
+    """开启 HUMANIZE_JITTER 时随机等待一段时间"""
+    if HUMANIZE_JITTER:
+        time.sleep(random.uniform(*HUMANIZE_JITTER))
+
+def wait_for_chat_uuid(driver, timeout: float = SEND_TIMEOUT) -> Optional[str]:
+    """等待页面跳转到 /chat/<uuid> 并返回会话UUID"""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: CHAT_UUID_PATTERN.search(d.current_url)
+        )
+    except TimeoutException:
+        logger.warning("Page did not navigate to a chat session")
+        return None
+    return CHAT_UUID_PATTERN.search(driver.current_url).group(1)
+
+def wait_for_chat_url(worker: BrowserWorker, timeout: float = SEND_TIMEOUT) -> Tuple[Optional[str], Optional[str]]:
+    """
+    等待当前工作线程的标签页跳转到会话页，返回 (会话UUID, 页面地址)；
+    每次检查之间释放 lock，其他标签页可以继续操作
+    """
+    deadline = time.time() + timeout
+    while True:
+        with worker.use_driver() as driver:
+            url = driver.current_url
+        match = CHAT_UUID_PATTERN.search(url)
+        if match:
+            return match.group(1), url
+        if time.time() >= deadline:
+            logger.warning("Page did not navigate to a chat session")
+            return None, None
+        time.sleep(0.1)
+
+def fetch_via_http(worker: BrowserWorker, fetch: Callable[[HttpSession], Dict[str, Any]]) -> Dict[str, Any]:
+    """直接通过 HTTP 获取 JSON，凭据失效时从浏览器重新获取一次"""
+    try:
+        return fetch(worker.http_session)
+    except HttpSessionExpired:
+        with worker.use_driver() as driver:
+            worker.http_session.harvest(driver)
+        return fetch(worker.http_session)
+
+def run_page_script(worker: BrowserWorker, script: str, *args) -> Any:
+    """在聊天页面中执行异步脚本"""
+    with worker.use_driver() as driver:
+        if not driver.current_url.startswith(CHAT_URL):
+            driver.get(CHAT_URL)
+        return driver.execute_async_script(script, *args)
+
+def fetch_chat_page(worker: BrowserWorker, cursor: Optional[float] = None) -> Dict[str, Any]:
+    """获取一页会话列表，cursor 为 None 时获取最近的一页；只有 HTTP 后端支持翻页"""
+    if worker.http_session:
+        return fetch_via_http(worker, lambda session: session.fetch_chat_list(cursor))
+    # ChatListCode 不接受参数，只能获取最近的一页
+    return run_page_script(worker, ChatListCode)
+
+def find_chat_uuid(worker: BrowserWorker, request: Dict[str, Any], chat_start_time: float) -> Optional[str]:
+    """
+    页面没有跳转时，在发送前后创建的会话中查找第一条用户消息与本次输入一致、
+    且尚未分配给其他请求的会话，返回其UUID
+    """
+    index = chat_index(worker)
+    index.refresh(lambda cursor: fetch_chat_page(worker, cursor), CHAT_LIST_MAX_PAGES if worker.http_session else 1)
+    expected = normalize_input(format_input(request["messages"]))
+
+    for session in index.between(chat_start_time - CHAT_CORRELATION_WINDOW, time.time() + CHAT_CORRELATION_WINDOW):
+        if session["claimed_by"]:
+            continue
+        chat_history = get_full_chat_history(worker, session["id"])
+        messages = chat_history.data.biz_data.chat_messages if chat_history else []
+        first = next((message for message in messages if message.role == "USER"), None)
+        if first and normalize_input(first.content or "") == expected and index.claim(session["id"], request["id"]):
+            return session["id"]
+
+    logger.warning(f"No chat session found for request {request['id']} near timestamp {chat_start_time}")
     return None
 
-def get_chat_history(chat_uuid: str) -> Optional[ChatHistoryResponse]:
-    """获取指定聊天会话的历史记录"""
-    
-    if not driver.current_url.startswith(CHAT_URL):
-        driver.get(CHAT_URL)
-    
+def get_full_chat_history(worker: BrowserWorker, chat_uuid: str) -> Optional[ChatHistoryResponse]:
+    """获取会话的完整历史，不使用也不更新 history_cursors，用于查看不属于当前请求的会话"""
+    if worker.http_session:
+        chat_history = fetch_via_http(worker, lambda session: session.fetch_chat_history(chat_uuid))
+    else:
+        chat_history = run_page_script(worker, ChatHistoryCode, chat_uuid)
+    return ChatHistoryResponse.from_dict(chat_history) if chat_history else None
+
+def get_chat_history(worker: BrowserWorker, chat_uuid: str) -> Optional[ChatHistoryResponse]:
+    """
+    获取指定聊天会话的历史记录
+
+    页面脚本只返回上次看到的最后一条消息及之后的消息，返回的 chat_messages 可能不是完整历史；
+    HTTP 接口不支持游标，仍然返回完整历史，但只有被访问的消息才会被解析
+    """
     
-    chat_history = driver.execute_async_script(ChatHistoryCode, chat_uuid)
+    if worker.http_session:
+        chat_history = fetch_via_http(worker, lambda session: session.fetch_chat_history(chat_uuid))
+    else:
+        cursor = get_history_cursor(chat_uuid)
+        chat_history = run_page_script(worker, ChatHistoryTailCode, chat_uuid,
+                                       cursor["message_id"] if cursor else None)
     
     
     if chat_history:
-        return ChatHistoryResponse.from_json(json.dumps(chat_history))
+        parse_started = time.time()
+        response = ChatHistoryResponse.from_dict(chat_history)
+        Metrics.observe_stage("parse", time.time() - parse_started)
+        update_history_cursor(chat_uuid, response.get_last_message())
+        return response
     return None
 
-def poll_for_chat_completion(chat_uuid: str, start_time: float) -> ChatCompletion:
-    """轮询等待聊天完成"""
-    timeout = 240  
-    poll_interval = 5  
+def get_history_cursor(chat_uuid: str) -> Optional[Dict[str, Any]]:
+    with history_cursors_lock:
+        return history_cursors.get(chat_uuid)
+
+def update_history_cursor(chat_uuid: str, message):
+    """记录会话最后一条消息的位置，下次只获取它及之后的消息"""
+    if message is None:
+        return
+    with history_cursors_lock:
+        history_cursors[chat_uuid] = {
+            "message_id": message.message_id,
+            "length": message_length(message),
+            "status": message.status,
+        }
+        history_cursors.move_to_end(chat_uuid)
+        while len(history_cursors) > HISTORY_CURSOR_LIMIT:
+            history_cursors.popitem(last=False)
+
+def poll_for_chat_completion(worker: BrowserWorker, chat_uuid: str, request: Dict[str, Any]) -> ChatCompletion:
+    """轮询等待聊天完成，轮询间隔随内容增长自适应调整"""
+    poller = AdaptivePoller(request["deadline"], POLL_INITIAL_INTERVAL, POLL_MAX_INTERVAL,
+                            cancelled=request["cancelled"])
     
-    while time.time() - start_time < timeout:
+    while True:
         
-        chat_history = get_chat_history(chat_uuid)
+        chat_history = get_chat_history(worker, chat_uuid)
+        last_message = current_reply(chat_history, request)
+        record_progress(request, last_message)
         
-        if chat_history and chat_history.data.biz_data.chat_messages:
-            last_message = chat_history.data.biz_data.chat_messages[-1]
+        if last_message and last_message.status == "FINISHED":
+            logger.info(f"Chat completed: {chat_uuid} after {poller.polls + 1} polls")
+            return convert_to_chat_completion(chat_uuid, chat_history)
             
             
+        poller.wait(message_length(last_message))
+        
+def current_reply(chat_history: Optional[ChatHistoryResponse], request: Dict[str, Any]):
+    """返回本次请求的回复消息；继续已有会话时忽略之前轮次的消息"""
+    message = chat_history.get_last_message() if chat_history else None
+    if message is None or message.role != "ASSISTANT":
+        return None
+    if request["after_message_id"] is not None and message.message_id <= request["after_message_id"]:
+        return None
+    return message
+
+def record_progress(request: Dict[str, Any], message):
+    """记录首个 token 和生成完成相对发送完成的耗时"""
+    if request["sent_at"] is None or message_length(message) == 0:
+        return
+    now = time.time()
+    if request["first_token_at"] is None:
+        request["first_token_at"] = now
+        Metrics.observe_stage("first_token", now - request["sent_at"])
+    if message.status == "FINISHED":
+        Metrics.observe_stage("completion", now - request["sent_at"])
+        
+def message_length(message) -> int:
+    """用于判断生成进度的消息长度，包含思考内容"""
+    if message is None or message.role != "ASSISTANT":
+        return 0
+    return len(message.content or "") + len(message.thinking_content or "")
+        
+def stream_chat_completion(worker: BrowserWorker, request: Dict[str, Any], chat_uuid: str) -> ChatCompletion:
+    """轮询生成中的消息，把新增的 content 和 thinking_content 作为增量推送"""
+    poller = AdaptivePoller(request["deadline"], POLL_INITIAL_INTERVAL, STREAM_POLL_INTERVAL,
+                            target_growth=STREAM_CHUNK_SIZE, cancelled=request["cancelled"])
+    content_sent = 0
+    thinking_sent = 0
+    role_sent = False
+
+    while True:
+
+        chat_history = get_chat_history(worker, chat_uuid)
+        last_message = current_reply(chat_history, request)
+        record_progress(request, last_message)
+
+        if last_message:
+            created = int(chat_history.data.biz_data.chat_session.inserted_at)
+            content = last_message.content or ""
+            thinking = last_message.thinking_content or ""
+
+            if len(content) > content_sent or len(thinking) > thinking_sent:
+                emit_delta(request, convert_to_chat_completion_chunk(
+                    chat_uuid,
+                    created,
+                    content=content[content_sent:],
+                    reasoning_content=thinking[thinking_sent:],
+                    role=None if role_sent else "assistant",
+                ))
+                content_sent = len(content)
+                thinking_sent = len(thinking)
+                role_sent = True
+
             if last_message.status == "FINISHED":
                 logger.info(f"Chat completed: {chat_uuid}")
+                emit_delta(request, convert_to_chat_completion_chunk(chat_uuid, created, finish_reason="stop"))
                 return convert_to_chat_completion(chat_uuid, chat_history)
-        
-        
-        time.sleep(poll_interval)
-    
-    
-    raise TimeoutError(f"Chat completion timed out after {timeout} seconds")
+
+        poller.wait(message_length(last_message))
+
+def run_batch_request(body: Dict[str, Any], stop: threading.Event) -> ChatCompletion:
+    """处理批量任务中的一行请求，批量任务停止时取消"""
+    return create_and_get_chat_response(
+        body["messages"],
+        BATCH_REQUEST_TIMEOUT,
+        params={"model": body.get("model")},
+        priority=resolve_priority(requested=BATCH_PRIORITY),
+        stop=stop,
+    )
+
+batch_jobs = BatchJobs(BATCH_DIR, run_batch_request, BATCH_RATE, BATCH_CONCURRENCY)
+batch_jobs.start()
 
 def shutdown():
     """清理资源"""
-    global driver
-    
-    
-    request_queue.put(None)
-    worker_thread.join()
-    
     
-    if driver:
-        driver.quit()
-        driver = None
-        logger.info("WebDriver closed")
+    batch_jobs.stop()
+    if chat_pruner:
+        chat_pruner.stop()
+    pool.shutdown()
+    http_client.close()
+    if response_cache:
+        response_cache.close()
+    logger.info("Browser pool closed")
+    
\ No newline at end of file
@@ -1,6 +1,33 @@
-from typing import TypedDict
+from typing import Optional, TypedDict
 
 
+REQUEST_QUEUED = "request.queued"
+"""请求进入队列，载荷为 RequestQueuedEvent"""
+CHAT_STARTED = "request.started"
+"""worker 开始处理请求，载荷为 ChatStartedEvent"""
+CHAT_GENERATING = "request.generating"
+"""得到上游会话UUID，载荷为 ChatGeneratingEvent"""
+CHAT_DELTA = "request.delta"
+"""流式请求的新增内容，载荷为 ChatDeltaEvent"""
+CHAT_FINISHED = "request.finished"
+"""请求成功完成，载荷为 ChatFinishedEvent"""
+CHAT_FAILED = "request.failed"
+"""请求失败、超时、被取消或被拒绝，载荷为 ChatFailedEvent"""
+
+REQUEST_EVENTS = (REQUEST_QUEUED, CHAT_STARTED, CHAT_GENERATING, CHAT_DELTA, CHAT_FINISHED, CHAT_FAILED)
+
+
+class RequestQueuedEvent(TypedDict):
+    """
+    请求入队事件定义
+    """
+    proxy_uuid: str
+    """代理UUID"""
+    priority: int
+    """队列优先级"""
+    queued_at: float
+    """入队时间戳"""
+
 class ChatStartedEvent(TypedDict):
     """
     聊天开始事件定义
@@ -9,6 +36,8 @@ class ChatStartedEvent(TypedDict):
     """聊天开始时间戳"""
     proxy_uuid: str
     """代理UUID"""
+    worker: int
+    """处理请求的 worker 编号"""
 
 class ChatGeneratingEvent(TypedDict):
     """
@@ -19,4 +48,47 @@ class ChatGeneratingEvent(TypedDict):
     proxy_uuid: str
     """代理UUID"""
     chat_start_time: float
-    """聊天开始时间戳"""
\ No newline at end of file
+    """聊天开始时间戳"""
+    chat_url: Optional[str]
+    """会话页面地址"""
+    sent_at: Optional[float]
+    """消息发送完成的时间戳"""
+    continued: bool
+    """是否在之前的会话中继续对话"""
+
+class ChatDeltaEvent(TypedDict):
+    """
+    增量内容事件定义
+    """
+    uuid: str
+    """聊天会话UUID"""
+    proxy_uuid: str
+    """代理UUID"""
+    content: str
+    """新增的回复内容"""
+    reasoning_content: str
+    """新增的思考内容"""
+
+class ChatFinishedEvent(TypedDict):
+    """
+    聊天完成事件定义
+    """
+    uuid: str
+    """聊天会话UUID"""
+    proxy_uuid: str
+    """代理UUID"""
+    duration: float
+    """从入队到完成的耗时（秒）"""
+
+class ChatFailedEvent(TypedDict):
+    """
+    聊天失败事件定义
+    """
+    uuid: Optional[str]
+    """聊天会话UUID，尚未得到时为 None"""
+    proxy_uuid: str
+    """代理UUID"""
+    outcome: str
+    """error、timeout、cancelled 或 rejected"""
+    error: str
+    """异常信息"""
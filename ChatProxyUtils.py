@@ -1,6 +1,8 @@
 from openai.types.chat.completion_create_params import CompletionCreateParamsNonStreaming
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
+from typing import List, Optional
 
 from ChatHistoryResponse import ChatHistoryResponse
 
@@ -39,3 +41,45 @@ def convert_to_chat_completion(chat_uuid, response:ChatHistoryResponse) -> ChatC
         ],
         response_format=None
     )
+
+
+def convert_to_chat_completion_chunk(chat_uuid, created: int,
+                                     content: Optional[str] = None,
+                                     reasoning_content: Optional[str] = None,
+                                     role: Optional[str] = None,
+                                     finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+    delta = {}
+    if role:
+        delta["role"] = role
+    if content:
+        delta["content"] = content
+    if reasoning_content:
+        delta["reasoning_content"] = reasoning_content
+    return ChatCompletionChunk(
+        object="chat.completion.chunk",
+        id=chat_uuid,
+        model="",
+        created=created,
+        choices=[
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }
+        ]
+    )
+
+
+def convert_completion_to_chunks(completion: ChatCompletion) -> List[ChatCompletionChunk]:
+    """把完整回复转换为流式增量，用于直接返回已有结果"""
+    message = completion.choices[0].message
+    return [
+        convert_to_chat_completion_chunk(
+            completion.id,
+            completion.created,
+            content=message.content,
+            reasoning_content=getattr(message, "reasioning_content", None),
+            role="assistant",
+        ),
+        convert_to_chat_completion_chunk(completion.id, completion.created, finish_reason="stop"),
+    ]
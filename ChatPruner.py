@@ -0,0 +1,99 @@
+import threading
+import time
+import logging as logger
+from collections import OrderedDict
+from typing import Callable, Dict
+
+
+class ChatPruner:
+    """
+    删除代理创建的上游会话，避免账号的会话列表越来越长，拖慢页面和会话列表接口
+
+    会话最后一次使用 keep_for 秒后由后台线程通过 delete(会话UUID, 账号) 删除，
+    删除失败的会话在之后的轮次中重试
+    """
+
+    def __init__(self, delete: Callable[[str, str], None], keep_for: float = 3600, interval: float = 60,
+                 max_attempts: int = 3):
+        self.delete = delete
+        self.keep_for = keep_for
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.deleted = 0
+        self.failed = 0
+        self._chats: "OrderedDict[str, float]" = OrderedDict()
+        """会话UUID -> 最后一次使用的时间，按时间排序"""
+        self._accounts: Dict[str, str] = {}
+        """会话UUID -> 创建会话的账号"""
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="chat-pruner", daemon=True)
+
+    def track(self, chat_uuid: str, account: str):
+        """记录 account 下的会话被使用，推迟它的删除时间"""
+        with self._lock:
+            self._chats[chat_uuid] = time.time()
+            self._accounts[chat_uuid] = account
+            self._chats.move_to_end(chat_uuid)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Pruning upstream chats failed")
+
+    def prune(self) -> int:
+        """删除所有到期的会话，返回本轮删除的数量"""
+        cutoff = time.time() - self.keep_for
+        with self._lock:
+            due = []
+            for chat_uuid, used_at in self._chats.items():
+                if used_at > cutoff:
+                    break
+                due.append((chat_uuid, self._accounts[chat_uuid]))
+
+        deleted = 0
+        for chat_uuid, account in due:
+            if self._stopped.is_set():
+                break
+            try:
+                self.delete(chat_uuid, account)
+            except Exception as e:
+                with self._lock:
+                    attempts = self._attempts.get(chat_uuid, 0) + 1
+                    if attempts < self.max_attempts:
+                        self._attempts[chat_uuid] = attempts
+                        logger.warning(f"Failed to delete chat {chat_uuid}, will retry: {e}")
+                        continue
+                    self._attempts.pop(chat_uuid, None)
+                    if self._chats.get(chat_uuid, cutoff + 1) <= cutoff:
+                        del self._chats[chat_uuid]
+                        del self._accounts[chat_uuid]
+                    self.failed += 1
+                logger.error(f"Giving up deleting chat {chat_uuid}: {e}")
+                continue
+
+            with self._lock:
+                self._attempts.pop(chat_uuid, None)
+                # 删除期间会话可能又被使用过，这时它已经不在了，不再重复删除
+                self._chats.pop(chat_uuid, None)
+                self._accounts.pop(chat_uuid, None)
+                self.deleted += 1
+            deleted += 1
+
+        if deleted:
+            logger.info(f"Deleted {deleted} upstream chat(s)")
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._chats), "deleted": self.deleted, "failed": self.failed}
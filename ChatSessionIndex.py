@@ -0,0 +1,119 @@
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ChatListResponse import Response
+
+
+class ChatSessionIndex:
+    """
+    一个账号下已知的上游会话，按会话UUID和创建时间索引，并记录每个会话属于哪个请求
+
+    refresh 从最近更新的会话开始逐页获取会话列表，遇到上次已经同步过的部分就停止，
+    平时只需要一页；claim 保证一个会话只会被分配给一个请求。
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._by_time: List[Tuple[float, str]] = []
+        """(inserted_at, 会话UUID)，按创建时间排序"""
+        self._synced_until: Optional[float] = None
+        """已经同步过的最近的 updated_at"""
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __contains__(self, chat_uuid: str) -> bool:
+        return chat_uuid in self._sessions
+
+    def record(self, chat_uuid: str, inserted_at: float, updated_at: Optional[float] = None,
+               claimed_by: Optional[str] = None):
+        """加入或更新一个会话，claimed_by 不为 None 时同时把它分配给该请求"""
+        with self._lock:
+            self._record(chat_uuid, inserted_at, updated_at or inserted_at)
+            if claimed_by is not None:
+                self._sessions[chat_uuid]["claimed_by"] = claimed_by
+
+    def _record(self, chat_uuid: str, inserted_at: float, updated_at: float):
+        session = self._sessions.get(chat_uuid)
+        if session is None:
+            session = self._sessions[chat_uuid] = {"id": chat_uuid, "inserted_at": inserted_at, "claimed_by": None}
+            bisect.insort(self._by_time, (inserted_at, chat_uuid))
+            while len(self._by_time) > self.max_entries:
+                _, oldest = self._by_time.pop(0)
+                del self._sessions[oldest]
+        elif session["inserted_at"] != inserted_at:
+            self._by_time.remove((session["inserted_at"], chat_uuid))
+            bisect.insort(self._by_time, (inserted_at, chat_uuid))
+            session["inserted_at"] = inserted_at
+        session["updated_at"] = updated_at
+
+    def refresh(self, fetch_page: Callable[[Optional[float]], Dict[str, Any]], max_pages: int = 5) -> int:
+        """
+        同步会话列表，返回新发现的会话数量
+
+        fetch_page(cursor) 返回 updated_at 不晚于 cursor 的一页会话，cursor 为 None 时返回第一页
+        """
+        with self._refresh_lock:
+            synced_until = self._synced_until
+            newest = synced_until
+            found = 0
+            cursor = None
+            for _ in range(max_pages):
+                biz_data = Response(fetch_page(cursor)).data.biz_data
+                oldest = None
+                with self._lock:
+                    for session in biz_data.chat_sessions:
+                        if not session.id or session.inserted_at is None:
+                            continue
+                        updated_at = session.updated_at or session.inserted_at
+                        found += session.id not in self._sessions
+                        self._record(session.id, session.inserted_at, updated_at)
+                        if session.pinned:
+                            # 置顶的会话总在最前面，不代表列表的时间位置
+                            continue
+                        oldest = updated_at if oldest is None else min(oldest, updated_at)
+                        newest = updated_at if newest is None else max(newest, updated_at)
+                if not biz_data.has_more or oldest is None:
+                    break
+                if synced_until is not None and oldest <= synced_until:
+                    break
+                if cursor is not None and oldest >= cursor:
+                    # 游标没有生效，继续翻页也只会拿到同一页
+                    break
+                cursor = oldest
+            self._synced_until = newest
+            return found
+
+    def between(self, start: float, end: float) -> List[Dict[str, Any]]:
+        """创建时间在 [start, end] 之间的会话，最新的在前"""
+        with self._lock:
+            low = bisect.bisect_left(self._by_time, (start, ""))
+            high = bisect.bisect_right(self._by_time, (end, "\uffff"))
+            return [dict(self._sessions[chat_uuid]) for _, chat_uuid in reversed(self._by_time[low:high])]
+
+    def claim(self, chat_uuid: str, owner: str) -> bool:
+        """把会话分配给 owner，已经属于其他请求时返回 False"""
+        with self._lock:
+            session = self._sessions.get(chat_uuid)
+            if session is None:
+                self._record(chat_uuid, time.time(), time.time())
+                session = self._sessions[chat_uuid]
+            if session["claimed_by"] not in (None, owner):
+                return False
+            session["claimed_by"] = owner
+            return True
+
+    def forget(self, chat_uuid: str):
+        with self._lock:
+            session = self._sessions.pop(chat_uuid, None)
+            if session:
+                self._by_time.remove((session["inserted_at"], chat_uuid))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "claimed": sum(1 for session in self._sessions.values() if session["claimed_by"]),
+            }
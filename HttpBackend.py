@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import logging as logger
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+import config
+from config import CHAT_URL
+
+
+_chat_url = urlsplit(CHAT_URL)
+
+API_BASE_URL: str = getattr(config, "API_BASE_URL", f"{_chat_url.scheme}://{_chat_url.netloc}")
+"""JSON 接口所在的地址，默认与 CHAT_URL 同源"""
+HISTORY_API_PATH: str = getattr(config, "HISTORY_API_PATH", "/api/v0/chat/history_messages")
+"""聊天历史接口，参数 chat_session_id"""
+CHAT_LIST_API_PATH: str = getattr(config, "CHAT_LIST_API_PATH", "/api/v0/chat_session/fetch_page")
+"""聊天会话列表接口"""
+CHAT_LIST_CURSOR_PARAM: str = getattr(config, "CHAT_LIST_CURSOR_PARAM", "lte_cursor.updated_at")
+"""会话列表接口的翻页参数，返回 updated_at 不晚于该值的会话"""
+DELETE_CHAT_API_PATH: str = getattr(config, "DELETE_CHAT_API_PATH", "/api/v0/chat_session/delete")
+"""删除聊天会话的接口，POST {"chat_session_id": ...}"""
+HTTP_TIMEOUT: float = getattr(config, "HTTP_TIMEOUT", 10)
+HTTP_MAX_CONNECTIONS: int = getattr(config, "HTTP_MAX_CONNECTIONS", 20)
+AUTH_TOKEN_SCRIPT: str = getattr(config, "AUTH_TOKEN_SCRIPT", """
+const raw = localStorage.getItem("userToken");
+if (!raw) return null;
+try {
+    const token = JSON.parse(raw);
+    return token && token.value ? token.value : token;
+} catch (e) {
+    return raw;
+}
+""")
+"""在页面中执行、返回 Authorization token 的脚本，返回 null 时只使用 cookie"""
+
+
+class HttpSessionExpired(Exception):
+    """接口返回 401/403，需要重新从浏览器获取凭据"""
+    pass
+
+
+class AsyncHttpClient:
+    """
+    在独立事件循环线程中运行的共享 httpx.AsyncClient，所有 worker 复用同一个连接池
+    """
+
+    def __init__(self, base_url: str = API_BASE_URL):
+        self.base_url = base_url
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self._loop.run_forever, name="http-backend-loop", daemon=True
+            ).start()
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS),
+            )
+
+    async def aget_json(self, path: str, params: Optional[Dict[str, Any]], headers: Dict[str, str]) -> Dict[str, Any]:
+        response = await self._client.get(path, params=params, headers=headers)
+        if response.status_code in (401, 403):
+            raise HttpSessionExpired(f"{path} returned {response.status_code}")
+        response.raise_for_status()
+        return loads(response.content)
+
+    def get_json(self, path: str, params: Optional[Dict[str, Any]], headers: Dict[str, str]) -> Dict[str, Any]:
+        """在 worker 线程中同步调用"""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.aget_json(path, params, headers), self._loop)
+        return future.result(HTTP_TIMEOUT + 1)
+
+    async def apost_json(self, path: str, body: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        response = await self._client.post(path, json=body, headers=headers)
+        if response.status_code in (401, 403):
+            raise HttpSessionExpired(f"{path} returned {response.status_code}")
+        response.raise_for_status()
+        return loads(response.content) if response.content else {}
+
+    def post_json(self, path: str, body: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.apost_json(path, body, headers), self._loop)
+        return future.result(HTTP_TIMEOUT + 1)
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(HTTP_TIMEOUT)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+
+
+http_client = AsyncHttpClient()
+
+
+class HttpSession:
+    """
+    从 WebDriver 中获取的 cookie 与认证头，用于绕过浏览器直接请求 JSON 接口
+    """
+
+    def __init__(self, driver, client: AsyncHttpClient = http_client):
+        self.client = client
+        self.headers: Dict[str, str] = {}
+        self.harvest(driver)
+
+    def harvest(self, driver):
+        """从浏览器读取当前登录状态，需要在持有 driver 锁时调用"""
+        cookies = "; ".join(f"{c['name']}={c['value']}" for c in driver.get_cookies())
+        headers = {
+            "Accept": "application/json",
+            "User-Agent": driver.execute_script("return navigator.userAgent"),
+            "Referer": CHAT_URL,
+        }
+        if cookies:
+            headers["Cookie"] = cookies
+        token = driver.execute_script(AUTH_TOKEN_SCRIPT)
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self.headers = headers
+        logger.info("Harvested HTTP session from WebDriver")
+
+    def fetch_chat_history(self, chat_uuid: str) -> Dict[str, Any]:
+        return self.client.get_json(HISTORY_API_PATH, {"chat_session_id": chat_uuid}, self.headers)
+
+    def fetch_chat_list(self, cursor: Optional[float] = None) -> Dict[str, Any]:
+        params = {CHAT_LIST_CURSOR_PARAM: cursor} if cursor is not None else None
+        return self.client.get_json(CHAT_LIST_API_PATH, params, self.headers)
+
+    def delete_chat(self, chat_uuid: str) -> Dict[str, Any]:
+        return self.client.post_json(DELETE_CHAT_API_PATH, {"chat_session_id": chat_uuid}, self.headers)
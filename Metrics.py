@@ -0,0 +1,40 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 240)
+
+QUEUE_DEPTH = Gauge("chat2api_queue_depth", "Requests waiting in the request queue")
+WORKERS = Gauge("chat2api_workers", "Browser workers in the pool")
+WORKERS_BUSY = Gauge("chat2api_workers_busy", "Browser workers currently processing a request")
+WORKERS_HEALTHY = Gauge("chat2api_workers_healthy", "Browser workers accepting requests")
+DRIVER_RESTARTS = Counter("chat2api_driver_restarts", "WebDriver restarts by the supervisor", ["worker", "reason"])
+"""reason: failure, recycle"""
+WORKER_BUSY_SECONDS = Counter(
+    "chat2api_worker_busy_seconds", "Time each worker spent processing requests", ["worker"]
+)
+"""rate(chat2api_worker_busy_seconds_total[1m]) 即为各 worker 的忙碌比例"""
+
+STAGE_SECONDS = Histogram(
+    "chat2api_stage_seconds",
+    "Latency of each request pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+"""stage: queue_wait, input, chat_uuid, first_token, completion, parse"""
+
+REQUESTS = Counter("chat2api_requests", "Finished requests by outcome", ["outcome"])
+"""outcome: success, error, cancelled, timeout, rejected"""
+CACHE_REQUESTS = Counter("chat2api_cache_requests", "Response cache lookups", ["result"])
+COALESCED_REQUESTS = Counter("chat2api_coalesced_requests", "Requests attached to an identical in-flight request")
+REQUEUED_REQUESTS = Counter("chat2api_requeued_requests", "Requests put back in the queue after a driver failure")
+PRUNED_CHATS = Counter("chat2api_pruned_chats", "Upstream chat sessions deleted by the pruner")
+CONTINUED_REQUESTS = Counter("chat2api_continued_requests", "Requests sent as a new turn of an existing upstream chat")
+BATCH_REQUESTS = Counter("chat2api_batch_requests", "Batch job lines processed by outcome", ["outcome"])
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def render() -> bytes:
+    return generate_latest()
@@ -0,0 +1,39 @@
+SetInputValueCode = """
+const [input, text] = arguments;
+const proto = input instanceof HTMLTextAreaElement
+    ? HTMLTextAreaElement.prototype
+    : HTMLInputElement.prototype;
+// React 等框架会拦截 value 属性，需要通过原型上的 setter 赋值才能触发其状态更新
+const setter = Object.getOwnPropertyDescriptor(proto, "value").set;
+input.focus();
+setter.call(input, text);
+input.dispatchEvent(new InputEvent("input", { bubbles: true, inputType: "insertFromPaste", data: text }));
+input.dispatchEvent(new Event("change", { bubbles: true }));
+return input.value === text;
+"""
+"""一次性写入输入框内容并派发 input/change 事件，参数为 (元素, 文本)，成功返回 true"""
+
+
+def tail_history_script(history_script: str) -> str:
+    """
+    包装获取历史记录的异步脚本，参数变为 (会话UUID, 游标)；
+    游标为上次看到的最后一条消息的 message_id，只返回从这条消息开始的部分，减少传输和解析的数据量
+    """
+    return f"""
+const [chatUuid, cursor] = arguments;
+const done = arguments[arguments.length - 1];
+const trim = (history) => {{
+    const bizData = history && history.data && history.data.biz_data;
+    if (cursor != null && bizData && Array.isArray(bizData.chat_messages)) {{
+        const tail = bizData.chat_messages.filter((message) => message.message_id >= cursor);
+        // 游标对应的消息已不存在（例如被重新生成）时返回完整历史
+        if (tail.length && tail[0].message_id === cursor) {{
+            bizData.chat_messages = tail;
+        }}
+    }}
+    done(history);
+}};
+(function () {{
+{history_script}
+}}).apply(this, [chatUuid, trim]);
+"""
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from queue import PriorityQueue
+from typing import Any, Callable, Dict, List, Optional
+
+
+class AdmissionError(Exception):
+    """请求因过载被拒绝，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(AdmissionError):
+    """队列已满或预计等待时间超过上限"""
+    pass
+
+
+class QueueWaitTimeout(AdmissionError):
+    """请求在队列中等待的时间超过上限"""
+    pass
+
+
+class NoHealthyWorkers(AdmissionError):
+    """没有可以处理请求的浏览器"""
+    pass
+
+
+class RequestCancelled(Exception):
+    """请求已被客户端取消"""
+    pass
+
+
+class RequestQueue:
+    """
+    有容量上限的优先级队列，priority 越小越先处理，同一优先级内先进先出
+
+    通过观察到的平均处理时间估算排队等待时间，用于拒绝注定超时的请求并计算 Retry-After。
+    """
+
+    def __init__(self, max_depth: int = 0, max_wait: float = 0, initial_service_time: float = 30.0):
+        self.max_depth = max_depth
+        """排队请求数上限，0 表示不限制"""
+        self.max_wait = max_wait
+        """排队等待时间上限（秒），0 表示不限制"""
+        self.service_time = initial_service_time
+        """平滑后的单个请求处理时间（秒）"""
+        self.capacity = 1
+        """同时处理请求的数量，由浏览器池设置"""
+        self._queue: PriorityQueue = PriorityQueue()
+        self._counter = itertools.count()
+        self._requeue_counter = itertools.count(-1, -1)
+        self._lock = threading.Lock()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def estimated_wait(self, depth: Optional[int] = None) -> float:
+        """按队列深度估算新请求开始处理前需要等待的时间"""
+        depth = self.qsize() if depth is None else depth
+        return depth * self.service_time / max(self.capacity, 1)
+
+    def retry_after(self) -> int:
+        """排空当前队列预计需要的秒数"""
+        return max(1, math.ceil(self.estimated_wait()))
+
+    def put(self, request: Dict[str, Any], priority: int = 0):
+        """放入请求，过载时抛出 QueueFullError"""
+        with self._lock:
+            depth = self.qsize()
+            if self.max_depth and depth >= self.max_depth:
+                raise QueueFullError(f"Request queue is full ({depth} waiting)", self.retry_after())
+            if self.max_wait and self.estimated_wait(depth) > self.max_wait:
+                raise QueueFullError(
+                    f"Estimated queue wait exceeds {self.max_wait} seconds", self.retry_after()
+                )
+            request["enqueued_at"] = time.time()
+            self._queue.put((priority, next(self._counter), request))
+
+    def requeue(self, request: Dict[str, Any], priority: int = 0):
+        """重新放入已经被接纳过的请求，不受容量限制，排在同一优先级的新请求之前"""
+        request["enqueued_at"] = time.time()
+        self._queue.put((priority, next(self._requeue_counter), request))
+
+    def put_sentinel(self):
+        """放入结束标记，排在所有请求之后"""
+        self._queue.put((math.inf, next(self._counter), None))
+
+    def remove(self, predicate: Callable[[Dict[str, Any]], bool]) -> List[Dict[str, Any]]:
+        """从队列中取出所有满足 predicate 的请求"""
+        with self._queue.mutex:
+            kept = []
+            removed = []
+            for entry in self._queue.queue:
+                (removed if entry[2] is not None and predicate(entry[2]) else kept).append(entry)
+            if removed:
+                heapq.heapify(kept)
+                self._queue.queue[:] = kept
+        return [entry[2] for entry in removed]
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        return self._queue.get()[2]
+
+    def waited_too_long(self, request: Dict[str, Any]) -> bool:
+        return bool(self.max_wait) and time.time() - request["enqueued_at"] > self.max_wait
+
+    def record_service_time(self, seconds: float):
+        with self._lock:
+            self.service_time = 0.8 * self.service_time + 0.2 * seconds
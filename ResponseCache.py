@@ -0,0 +1,121 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging as logger
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+
+def _normalize_content(content: Any) -> str:
+    if isinstance(content, list):
+        content = "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return (content or "").strip()
+
+
+def cache_key(messages: List[ChatCompletionMessageParam], params: Optional[Dict[str, Any]] = None) -> str:
+    """根据规范化后的 messages 和影响结果的参数计算缓存键"""
+    normalized = {
+        "messages": [
+            {"role": msg.get("role", "user"), "content": _normalize_content(msg.get("content"))}
+            for msg in messages
+        ],
+        "params": {k: v for k, v in (params or {}).items() if v is not None},
+    }
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    以提示为键的回复缓存：内存中 LRU + TTL，可选 sqlite 持久化以便重启后继续命中
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, path: Optional[str] = None,
+                 disk_max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries or max_entries * 10
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, ChatCompletion]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._puts = 0
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, value TEXT)"
+            )
+            self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, value FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[0]):
+                    completion = ChatCompletion.model_validate_json(row[1])
+                    self._remember(key, row[0], completion)
+                    self.hits += 1
+                    return completion
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, completion: ChatCompletion):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, completion)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, created, value) VALUES (?, ?, ?)",
+                    (key, created, completion.to_json(indent=None)),
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._prune_disk()
+                self._db.commit()
+            except sqlite3.Error:
+                logger.exception("Failed to persist cached response")
+
+    def _remember(self, key: str, created: float, completion: ChatCompletion):
+        self._entries[key] = (created, completion)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY created DESC LIMIT ?)",
+            (self.disk_max_entries,),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
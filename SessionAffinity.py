@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from ResponseCache import cache_key
+
+
+def split_new_turn(messages: List[ChatCompletionMessageParam]) -> Tuple[List[ChatCompletionMessageParam], List[ChatCompletionMessageParam]]:
+    """在最后一条 assistant 消息之后切开，返回 (之前的对话, 新的消息)"""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].get("role") == "assistant":
+            return messages[:index + 1], messages[index + 1:]
+    return [], messages
+
+
+class SessionAffinity:
+    """
+    记录对话前缀所在的上游会话：以包括回复在内的整段对话的哈希为键，
+    保存会话 UUID、页面地址、最后一条消息的 message_id 和所属账号（profile）。
+
+    携带相同前缀的后续请求可以回到该会话，只发送新的用户消息。
+    每条记录只能被取出一次，会话继续之后由新的回复生成新的记录。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, messages: List[ChatCompletionMessageParam], reply: str, chat_uuid: str,
+                 chat_url: str, message_id: int, account: str):
+        key = cache_key(list(messages) + [{"role": "assistant", "content": reply}])
+        with self._lock:
+            self._entries[key] = {
+                "chat_uuid": chat_uuid,
+                "chat_url": chat_url,
+                "message_id": message_id,
+                "account": account,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def take(self, messages: List[ChatCompletionMessageParam], account: str) -> Optional[Dict[str, Any]]:
+        """
+        取出与 messages 前缀对应的会话，返回的记录中 messages 为需要发送的新消息；
+        没有记录、已过期或属于其他账号时返回 None
+        """
+        prefix, new_turn = split_new_turn(messages)
+        if not prefix or not new_turn:
+            return None
+        key = cache_key(prefix)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry["created"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None or entry["account"] != account:
+                self.misses += 1
+                return None
+            del self._entries[key]
+            self.hits += 1
+        return dict(entry, messages=new_turn)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -1,21 +1,203 @@
-from fastapi import FastAPI, HTTPException, Response,status
+import asyncio
+import json
+from fastapi import FastAPI, Header, HTTPException, Request, Response,status
 from datetime import datetime
+from typing import Optional
 from sse_starlette.sse import EventSourceResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, JSONResponse
 from openai.types.chat.completion_create_params import CompletionCreateParamsNonStreaming
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
-from ChatProxy import create_and_get_chat_response
+from BatchJobs import BatchInputError
+from ChatProxy import acreate_and_get_chat_response, astream_chat_response, batch_jobs, pool, request_queue, resolve_priority, response_cache, session_affinity, chat_pruner, shutdown
+from ChatProxyEvent import CHAT_DELTA, REQUEST_EVENTS
+from EventHub import event as event_hub
+import Metrics
+from RequestQueue import AdmissionError, NoHealthyWorkers
 
-from utils import simulate_streaming, simulate_streaming_pp
+from utils import simulate_streaming_pp, stream_chunks
 
 
 app = FastAPI()
 
+EVENT_STREAM_BUFFER = 1024
+"""每个 /events 连接缓冲的事件数量，客户端读取太慢时丢弃新事件"""
+
+
+@app.on_event("startup")
+async def bind_event_hub():
+    # worker 线程通过 emit_nowait 发布事件，async 订阅者需要在这个事件循环中执行
+    event_hub.bind_loop(asyncio.get_running_loop())
+
+
+@app.on_event("shutdown")
+async def close_chat_proxy():
+    # 停止批量任务、关闭浏览器；会等待 worker 线程结束，放在线程池中执行
+    await run_in_threadpool(shutdown)
+
+
+@app.exception_handler(TimeoutError)
+async def timeout_error_handler(request, exc: TimeoutError):
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"error": {"message": str(exc), "type": "timeout"}},
+    )
+
+
+@app.exception_handler(NoHealthyWorkers)
+async def no_healthy_workers_handler(request, exc: NoHealthyWorkers):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"error": {"message": str(exc), "type": "service_unavailable"}},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+
+@app.exception_handler(AdmissionError)
+async def admission_error_handler(request, exc: AdmissionError):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"error": {"message": str(exc), "type": "rate_limit_exceeded"}},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+
+async def cancel_on_disconnect(http_request: Request, awaitable):
+    """
+    等待结果期间定期检查客户端是否断开，断开时取消等待，取消会传递到请求队列
+    """
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=1)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            task.cancel()
+            return None
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "queued": request_queue.qsize(),
+        "estimated_wait": request_queue.estimated_wait(),
+        "busy_workers": pool.busy_count(),
+        "workers": len(pool.workers),
+        "healthy_workers": pool.healthy_count(),
+        "cache": response_cache.stats() if response_cache else None,
+        "session_affinity": session_affinity.stats() if session_affinity else None,
+        "pruned_chats": chat_pruner.stats() if chat_pruner else None,
+    }
+
+
+@app.get("/events")
+async def events(http_request: Request, deltas: bool = False):
+    """以 SSE 推送请求的生命周期事件，deltas 为 true 时同时推送流式请求的增量内容"""
+    names = [name for name in REQUEST_EVENTS if deltas or name != CHAT_DELTA]
+    queue: asyncio.Queue = asyncio.Queue(EVENT_STREAM_BUFFER)
+
+    def subscriber(name: str):
+        async def forward(payload):
+            try:
+                queue.put_nowait({"event": name, "data": json.dumps(payload)})
+            except asyncio.QueueFull:
+                pass
+        return forward
+
+    handlers = {name: subscriber(name) for name in names}
+    for name, handler in handlers.items():
+        event_hub.on(name, handler)
+
+    async def stream():
+        try:
+            while not await http_request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            for name, handler in handlers.items():
+                event_hub.off(name, handler)
+
+    return EventSourceResponse(stream())
+
+
+@app.post("/batches")
+async def create_batch(http_request: Request):
+    """上传 JSONL，每行一个 chat completion 请求（或 {"custom_id", "body"}），返回任务状态"""
+    data = await http_request.body()
+    try:
+        # 解析和写盘在线程池中进行，大文件不会阻塞事件循环
+        return await run_in_threadpool(batch_jobs.submit, data)
+    except (BatchInputError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@app.get("/batches/{job_id}")
+async def get_batch(job_id: str):
+    job = batch_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    return job
+
+
+@app.get("/batches/{job_id}/results")
+async def get_batch_results(job_id: str):
+    """下载已经完成的结果，任务进行中时返回目前为止的部分"""
+    path = batch_jobs.results_path(job_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    # 任务进行中文件还在增长，只返回请求时已有的部分，保证内容与 Content-Length 一致
+    size = batch_jobs.results_size(job_id)
+    return StreamingResponse(
+        read_file_prefix(path, size),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{job_id}.jsonl"',
+        },
+    )
+
+
+def read_file_prefix(path: str, size: int, chunk_size: int = 64 * 1024):
+    """逐块读取文件的前 size 个字节"""
+    with open(path, "rb") as f:
+        while size > 0:
+            chunk = f.read(min(chunk_size, size))
+            if not chunk:
+                break
+            size -= len(chunk)
+            yield chunk
+
+
+@app.post("/batches/{job_id}/cancel")
+async def cancel_batch(job_id: str):
+    job = batch_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    return job
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=Metrics.render(), media_type=Metrics.CONTENT_TYPE_LATEST)
+
 
 @app.post("/chat/completions",)
-async def create_chat_completions(d:dict):
+async def create_chat_completions(d:dict,
+                                  http_request: Request,
+                                  x_request_timeout: Optional[float] = Header(None),
+                                  x_cache_bypass: Optional[str] = Header(None),
+                                  cache_control: Optional[str] = Header(None),
+                                  authorization: Optional[str] = Header(None),
+                                  x_priority: Optional[str] = Header(None)):
     data:CompletionCreateParamsNonStreaming=d
+    use_cache = not x_cache_bypass and "no-cache" not in (cache_control or "")
+    cache_params = {"model": data.get("model")}
+    api_key = authorization.removeprefix("Bearer ").strip() if authorization else None
+    priority = resolve_priority(api_key, x_priority)
     
     if data.get("functions"):
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Functions are not supported in this endpoint.")
@@ -27,15 +209,18 @@ async def create_chat_completions(d:dict):
         return create_and_get_typed_response()
     
     if data.get("stream"):
-        resp =create_and_get_chat_response(data.get("messages", []))
-        
         return StreamingResponse(
-            simulate_streaming(resp),
+            stream_chunks(astream_chat_response(data.get("messages", []), x_request_timeout, use_cache, cache_params, priority)),
             media_type="text/event-stream"
         )
 
     
-    resp =create_and_get_chat_response(data.get("messages", []))
+    resp = await cancel_on_disconnect(
+        http_request,
+        acreate_and_get_chat_response(data.get("messages", []), x_request_timeout, use_cache, cache_params, priority),
+    )
+    if resp is None:
+        return Response(status_code=499)
     return resp
 
 if __name__ == "__main__":
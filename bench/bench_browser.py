@@ -0,0 +1,64 @@
+"""
+比较普通模式和轻量模式（LIGHTWEIGHT_BROWSER）下浏览器的启动时间、页面可用时间和内存占用。
+
+    python -m bench.bench_browser --repeat 3
+
+两种模式都使用 PROFILE_PATH 的副本。内存为 Firefox 全部进程的 RSS 之和，需要安装 psutil。
+"""
+import argparse
+import shutil
+import time
+from typing import Optional
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.wait import WebDriverWait
+
+from ChatProxy import LIGHTWEIGHT_PREFS, copy_profile, init_driver
+from config import PROFILE_PATH
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def firefox_rss(driver) -> Optional[int]:
+    """geckodriver 启动的所有子进程的 RSS 之和（字节）"""
+    if psutil is None:
+        return None
+    service = psutil.Process(driver.service.process.pid)
+    return sum(child.memory_info().rss for child in service.children(recursive=True))
+
+
+def measure(lightweight: bool, settle: float):
+    profile = copy_profile(PROFILE_PATH, LIGHTWEIGHT_PREFS if lightweight else None)
+    start = time.perf_counter()
+    driver = init_driver(profile, headless=lightweight)
+    try:
+        launched = time.perf_counter() - start
+        WebDriverWait(driver, 60).until(expected_conditions.element_to_be_clickable((By.ID, "chat-input")))
+        ready = time.perf_counter() - start
+        time.sleep(settle)
+        return launched, ready, firefox_rss(driver)
+    finally:
+        driver.quit()
+        shutil.rmtree(profile, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds to wait after page ready before reading RSS")
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'launch (s)':>11} {'ready (s)':>10} {'RSS (MB)':>9}")
+    for lightweight in (False, True):
+        for _ in range(args.repeat):
+            launched, ready, rss = measure(lightweight, args.settle)
+            memory = f"{rss / 2**20:9.0f}" if rss is not None else f"{'n/a':>9}"
+            print(f"{'lightweight' if lightweight else 'default':>12} {launched:11.2f} {ready:10.2f} {memory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+测量 EventHub 每秒能分发的事件数。
+
+    python -m bench.bench_event_hub --handlers 1 10 100
+
+- emit: 依次等待每个处理函数（async 处理函数）
+- concurrent: emit_concurrent，同时等待全部处理函数
+- nowait: emit_nowait，只统计调度本身（线程处理函数）
+- wildcard: 与 emit 相同，但一半处理函数订阅的是 'chat.*'
+"""
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from event import EventHub
+
+
+async def handler(*args, **kwargs):
+    return None
+
+
+def sync_handler(*args, **kwargs):
+    return None
+
+
+async def rate(emit: Callable[[], Awaitable], seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            await emit()
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+async def bench(handlers: int, seconds: float):
+    hub = EventHub()
+    wildcard = EventHub()
+    threaded = EventHub()
+    for index in range(handlers):
+        hub.on("chat.delta", handler, priority=index % 3)
+        wildcard.on("chat.*" if index % 2 else "chat.delta", handler, priority=index % 3)
+        threaded.on("chat.delta", sync_handler)
+
+    async def nowait():
+        threaded.emit_nowait("chat.delta", "payload")
+
+    results = [
+        await rate(lambda: hub.emit("chat.delta", "payload"), seconds),
+        await rate(lambda: hub.emit_concurrent("chat.delta", "payload"), seconds),
+        await rate(nowait, seconds),
+        await rate(lambda: wildcard.emit("chat.delta", "payload"), seconds),
+    ]
+    await threaded.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each measurement")
+    args = parser.parse_args()
+
+    print(f"{'handlers':>8} {'emit':>12} {'concurrent':>12} {'nowait':>12} {'wildcard':>12}  (events/s)")
+    for handlers in args.handlers:
+        results = asyncio.run(bench(handlers, args.seconds))
+        print(f"{handlers:>8} " + " ".join(f"{value:>12.0f}" for value in results))
+
+
+if __name__ == "__main__":
+    main()
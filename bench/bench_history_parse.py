@@ -0,0 +1,77 @@
+"""
+比较聊天历史的几种解析方式在长会话上的耗时。
+
+    python -m bench.bench_history_parse --messages 100 1000 5000
+
+- roundtrip: 旧做法，json.dumps 后再 from_json，并转换全部消息
+- from_dict: 直接使用脚本返回的 dict，只访问最后一条消息（轮询时的用法）
+- from_dict_all: 同上，但遍历全部消息
+- decode_json / decode_fast: HTTP 后端收到字节后用标准库 / orjson（若已安装）解码并解析
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict
+
+from ChatHistoryResponse import ChatHistoryResponse, loads
+
+
+def make_history(count: int, length: int) -> Dict[str, Any]:
+    text = ("The quick brown fox jumps over the lazy dog. " * (length // 45 + 1))[:length]
+    messages = [
+        {
+            "message_id": i + 1, "parent_id": i or None, "model": "",
+            "role": "USER" if i % 2 == 0 else "ASSISTANT", "thinking_enabled": False,
+            "ban_edit": False, "ban_regenerate": False, "status": "FINISHED",
+            "accumulated_token_usage": length, "files": [], "inserted_at": 1754950000.0 + i,
+            "search_enabled": True, "feedback": None, "content": text, "thinking_content": text,
+            "thinking_elapsed_secs": 3.0, "tips": [], "search_status": "FINISHED",
+            "search_results": [{"url": f"https://example.com/{i}/{j}", "title": text[:60]} for j in range(5)],
+        }
+        for i in range(count)
+    ]
+    return {"code": 0, "msg": "", "data": {"biz_code": 0, "biz_msg": "", "biz_data": {
+        "chat_session": {
+            "id": "bench", "seq_id": 1, "agent": "chat", "character": None, "title": "bench",
+            "title_type": "SYSTEM", "version": count, "current_message_id": count, "pinned": False,
+            "inserted_at": 1754950000.0, "updated_at": 1754950000.0 + count,
+        },
+        "chat_messages": messages, "cache_valid": False, "route_id": None,
+    }}}
+
+
+def timeit(func: Callable[[], Any], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--length", type=int, default=2000, help="characters per message")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    def touch_all(response: ChatHistoryResponse):
+        for message in response.data.biz_data.chat_messages:
+            message.search_results
+
+    print(f"decoder: {loads.__module__}")
+    print(f"{'messages':>8} {'roundtrip':>10} {'from_dict':>10} {'dict_all':>10} {'dec_json':>10} {'dec_fast':>10}  (ms)")
+    for count in args.messages:
+        history = make_history(count, args.length)
+        body = json.dumps(history).encode("utf-8")
+        results = [
+            timeit(lambda: touch_all(ChatHistoryResponse.from_json(json.dumps(history))), args.repeat),
+            timeit(lambda: ChatHistoryResponse.from_dict(history).get_last_message(), args.repeat),
+            timeit(lambda: touch_all(ChatHistoryResponse.from_dict(history)), args.repeat),
+            timeit(lambda: ChatHistoryResponse.from_dict(json.loads(body)).get_last_message(), args.repeat),
+            timeit(lambda: ChatHistoryResponse.from_dict(loads(body)).get_last_message(), args.repeat),
+        ]
+        print(f"{count:>8} " + " ".join(f"{seconds * 1000:>10.3f}" for seconds in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+比较批量写入与 send_keys 逐字输入的耗时随提示长度的变化。
+
+    python -m bench.bench_input --sizes 1000 5000 20000 50000
+
+使用 PROFILE_PATH 的副本启动一个浏览器，只写入输入框，不会发送消息。
+"""
+import argparse
+import shutil
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.wait import WebDriverWait
+
+from ChatProxy import copy_profile, init_driver
+from PageScripts import SetInputValueCode
+from config import PROFILE_PATH
+
+
+def make_prompt(size: int) -> str:
+    text = "The quick brown fox jumps over the lazy dog. "
+    return (text * (size // len(text) + 1))[:size]
+
+
+def measure(driver, size: int, use_send_keys: bool) -> float:
+    input_box = driver.find_element(By.ID, "chat-input")
+    input_box.clear()
+    prompt = make_prompt(size)
+
+    start = time.perf_counter()
+    if use_send_keys:
+        input_box.send_keys(prompt)
+    else:
+        ok = driver.execute_script(SetInputValueCode, input_box, prompt)
+        if not ok:
+            raise RuntimeError("bulk input was rejected by the page")
+    elapsed = time.perf_counter() - start
+
+    assert len(input_box.get_attribute("value")) == size
+    input_box.clear()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--send-keys-limit", type=int, default=20000,
+                        help="skip send_keys for prompts longer than this, it gets very slow")
+    args = parser.parse_args()
+
+    profile = copy_profile(PROFILE_PATH)
+    driver = init_driver(profile)
+    try:
+        WebDriverWait(driver, 30).until(
+            expected_conditions.element_to_be_clickable((By.ID, "chat-input"))
+        )
+        print(f"{'chars':>8} {'bulk (ms)':>12} {'send_keys (ms)':>16}")
+        for size in args.sizes:
+            bulk = min(measure(driver, size, False) for _ in range(args.repeat))
+            if size <= args.send_keys_limit:
+                typed = f"{min(measure(driver, size, True) for _ in range(args.repeat)) * 1000:16.1f}"
+            else:
+                typed = f"{'skipped':>16}"
+            print(f"{size:>8} {bulk * 1000:12.1f} {typed}")
+    finally:
+        driver.quit()
+        shutil.rmtree(profile, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+在 FakeDriver + MockUpstream 上压测 api.py 的完整请求流程，输出吞吐量和 p50/p99 延迟。
+
+    python -m bench.bench_pipeline --requests 200 --concurrency 16 --pool-size 4
+    python -m bench.bench_pipeline --stream --chars-per-second 500
+    python -m bench.bench_pipeline --http-backend
+    python -m bench.bench_pipeline --pool-size 1 --tabs 4
+
+没有 config.py 或 JSCode.py 时使用占位模块，已有的 config.py 中与压测相关的设置会被参数覆盖。
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import List, Optional
+
+
+def prepare_environment(args):
+    """准备 config / JSCode，必须在导入 ChatProxy 之前调用"""
+    try:
+        import config
+    except ImportError:
+        config = types.ModuleType("config")
+        config.CHAT_URL = "http://mock.local/"
+        config.FIREFOX_BINARY = ""
+        config.PROFILE_PATH = tempfile.mkdtemp(prefix="chat2api-bench-")
+        sys.modules["config"] = config
+
+    try:
+        import JSCode  # noqa: F401
+    except ImportError:
+        js = types.ModuleType("JSCode")
+        js.ChatHistoryCode = "/* bench: chat history */"
+        js.ChatListCode = "/* bench: chat list */"
+        js.ChatMutationCode = "/* bench: chat mutation */"
+        sys.modules["JSCode"] = js
+
+    config.POOL_SIZE = args.pool_size
+    config.TABS_PER_DRIVER = args.tabs
+    config.PROFILE_PATHS = [config.PROFILE_PATH] * args.pool_size
+    config.HTTP_BACKEND = args.http_backend
+    config.API_BASE_URL = f"http://127.0.0.1:{args.upstream_port}"
+    config.CACHE_ENABLED = False
+    config.COALESCE_REQUESTS = False
+    config.MAX_QUEUE_DEPTH = 0
+    config.MAX_QUEUE_WAIT = 0
+    config.HUMANIZE_JITTER = None
+    config.LIGHTWEIGHT_BROWSER = False
+    return config
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def serve(app, port: int):
+    """在后台线程中用 uvicorn 提供 app，流式响应才能按块到达客户端"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(args):
+    import httpx
+
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(client: httpx.AsyncClient, index: int):
+        nonlocal failures
+        body = {
+            "model": "bench",
+            "stream": args.stream,
+            "messages": [{"role": "user", "content": f"benchmark prompt {index} " + "x" * args.prompt_length}],
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            first: Optional[float] = None
+            try:
+                if args.stream:
+                    async with client.stream("POST", "/chat/completions", json=body) as response:
+                        async for line in response.aiter_lines():
+                            if first is None and line.startswith("data: {"):
+                                first = time.perf_counter() - start
+                        ok = response.status_code == 200
+                else:
+                    response = await client.post("/chat/completions", json=body)
+                    ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if not ok:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            if first is not None:
+                first_tokens.append(first)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    print(f"requests     {args.requests} ({failures} failed), concurrency {args.concurrency}, "
+          f"pool {args.pool_size} x {args.tabs} tab(s)")
+    print(f"throughput   {len(latencies) / elapsed:.2f} req/s over {elapsed:.1f}s")
+    print(f"latency      p50 {percentile(latencies, 0.5):.3f}s  p99 {percentile(latencies, 0.99):.3f}s")
+    if first_tokens:
+        print(f"first chunk  p50 {percentile(first_tokens, 0.5):.3f}s  p99 {percentile(first_tokens, 0.99):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--tabs", type=int, default=1, help="tabs per driver")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--http-backend", action="store_true", help="fetch history over HTTP from a local MockUpstream server")
+    parser.add_argument("--port", type=int, default=38010, help="port the proxy under test listens on")
+    parser.add_argument("--upstream-port", type=int, default=38001)
+    parser.add_argument("--chars-per-second", type=float, default=400.0, help="simulated generation speed")
+    parser.add_argument("--answer-length", type=int, default=600)
+    parser.add_argument("--prompt-length", type=int, default=200)
+    parser.add_argument("--command-latency", type=float, default=0.002, help="simulated WebDriver round trip, seconds")
+    args = parser.parse_args()
+
+    config = prepare_environment(args)
+
+    import ChatProxy
+    from bench.fake_driver import FakeDriver
+    from bench.mock_upstream import MockUpstream, create_app
+
+    answer = ("lorem ipsum dolor sit amet " * (args.answer_length // 27 + 1))[:args.answer_length]
+    upstream = MockUpstream(args.chars_per_second, answer=answer)
+    ChatProxy.init_driver = lambda profile_path=None: FakeDriver(
+        upstream, config.CHAT_URL, command_latency=args.command_latency
+    )
+
+    if args.http_backend:
+        serve(create_app(upstream), args.upstream_port)
+
+    import api
+
+    serve(api.app, args.port)
+    asyncio.run(run_load(args))
+    ChatProxy.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+模拟 ChatProxy.py 用到的 WebDriver 接口，背后是 MockUpstream，
+可以在没有浏览器、账号和网络的情况下跑通整个请求流程。
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+
+from bench.mock_upstream import MockUpstream
+
+
+class FakeElement:
+    """模拟 id 为 chat-input 的输入框"""
+
+    def __init__(self, driver: "FakeDriver", tab: "FakeTab"):
+        self._driver = driver
+        self._tab = tab
+        self.value = ""
+
+    def send_keys(self, *keys: str):
+        for key in keys:
+            if Keys.RETURN in key or Keys.ENTER in key:
+                self._driver._submit(self.value, self._tab)
+                self.value = ""
+                continue
+            self._driver._delay(len(key) * self._driver.typing_delay)
+            self.value += key
+
+    def clear(self):
+        self._driver._delay()
+        self.value = ""
+
+    def click(self):
+        self._driver._delay()
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        self._driver._delay()
+        return self.value if name == "value" else None
+
+    def is_displayed(self) -> bool:
+        return True
+
+    def is_enabled(self) -> bool:
+        return True
+
+
+class FakeTab:
+    """一个标签页的地址、输入框和在其中创建的最后一个会话"""
+
+    def __init__(self, driver: "FakeDriver", handle: str, url: str):
+        self.handle = handle
+        self.url = url
+        self.input = FakeElement(driver, self)
+        self.last_chat_id: Optional[str] = None
+
+
+class FakeSwitchTo:
+    def __init__(self, driver: "FakeDriver"):
+        self._driver = driver
+
+    def window(self, handle: str):
+        self._driver._delay()
+        self._driver._tab = self._driver._tabs[handle]
+
+    def new_window(self, type_hint: Optional[str] = None):
+        self._driver._delay()
+        handle = f"tab-{len(self._driver._tabs)}"
+        self._driver._tabs[handle] = self._driver._tab = FakeTab(self._driver, handle, "about:blank")
+
+
+class FakeDriver:
+    """
+    按脚本内容分派 execute_script / execute_async_script，
+    command_latency 模拟每次 WebDriver 往返的延迟，typing_delay 模拟 send_keys 逐字输入的耗时
+    """
+
+    def __init__(self, upstream: MockUpstream, chat_url: str,
+                 command_latency: float = 0.002, typing_delay: float = 0.0005):
+        # 延迟导入，保证使用者可以先准备好 config 和 JSCode
+        from HttpBackend import AUTH_TOKEN_SCRIPT
+        from JSCode import ChatHistoryCode, ChatListCode, ChatMutationCode
+        from PageScripts import SetInputValueCode, tail_history_script
+
+        self.upstream = upstream
+        self.chat_url = chat_url
+        self.command_latency = command_latency
+        self.typing_delay = typing_delay
+        self.script_timeout = 30.0
+        self._tab = FakeTab(self, "tab-0", chat_url)
+        self._tabs: Dict[str, FakeTab] = {self._tab.handle: self._tab}
+        self.switch_to = FakeSwitchTo(self)
+        self._async_scripts = {
+            ChatHistoryCode: lambda chat_id: self.upstream.history(chat_id),
+            tail_history_script(ChatHistoryCode): self._history_tail,
+            ChatListCode: lambda: self.upstream.chat_list(),
+            ChatMutationCode: lambda *args: self._chat_path(),
+        }
+        self._scripts = {
+            SetInputValueCode: self._set_input_value,
+            AUTH_TOKEN_SCRIPT: lambda *args: "fake-token",
+            "return navigator.userAgent": lambda *args: "FakeDriver",
+            "return document.readyState": lambda *args: "complete",
+        }
+        self.crashed = False
+
+    def crash(self):
+        """模拟浏览器崩溃，之后的所有命令都会失败"""
+        self.crashed = True
+
+    def _delay(self, seconds: Optional[float] = None):
+        if self.crashed:
+            raise WebDriverException("Browsing context has been discarded")
+        time.sleep(self.command_latency if seconds is None else seconds)
+
+    def _submit(self, prompt: str, tab: FakeTab):
+        chat_id = tab.url.rsplit("/a/chat/s/", 1)[-1] if "/a/chat/s/" in tab.url else None
+        if chat_id in self.upstream.chats:
+            chat = self.upstream.continue_chat(chat_id, prompt)
+        else:
+            chat = self.upstream.create_chat(prompt)
+        tab.last_chat_id = chat.id
+        tab.url = f"{self.chat_url.rstrip('/')}/a/chat/s/{chat.id}"
+
+    def _chat_path(self) -> Optional[str]:
+        if self._tab.last_chat_id is None:
+            return None
+        return f"/a/chat/s/{self._tab.last_chat_id}"
+
+    def _history_tail(self, chat_id: str, cursor: Optional[int]) -> Optional[Dict[str, Any]]:
+        """与 tail_history_script 相同：只保留游标及之后的消息"""
+        history = self.upstream.history(chat_id)
+        if history is None or cursor is None:
+            return history
+        biz_data = history["data"]["biz_data"]
+        tail = [message for message in biz_data["chat_messages"] if message["message_id"] >= cursor]
+        if tail and tail[0]["message_id"] == cursor:
+            biz_data["chat_messages"] = tail
+        return history
+
+    def _set_input_value(self, element: FakeElement, text: str) -> bool:
+        element.value = text
+        return True
+
+    @property
+    def current_url(self) -> str:
+        self._delay(0)
+        return self._tab.url
+
+    @property
+    def current_window_handle(self) -> str:
+        return self._tab.handle
+
+    @property
+    def window_handles(self) -> List[str]:
+        return list(self._tabs)
+
+    def get(self, url: str):
+        self._delay()
+        self._tab.url = url
+
+    def find_element(self, by: str = By.ID, value: Optional[str] = None) -> FakeElement:
+        self._delay()
+        if by == By.ID and value == "chat-input":
+            return self._tab.input
+        raise NoSuchElementException(f"{by}={value}")
+
+    def find_elements(self, by: str = By.ID, value: Optional[str] = None) -> List[FakeElement]:
+        try:
+            return [self.find_element(by, value)]
+        except NoSuchElementException:
+            return []
+
+    def execute_script(self, script: str, *args) -> Any:
+        self._delay()
+        handler = self._scripts.get(script)
+        return handler(*args) if handler else None
+
+    def execute_async_script(self, script: str, *args) -> Any:
+        self._delay()
+        handler = self._async_scripts.get(script)
+        if handler is None:
+            raise TimeoutException("script not supported by FakeDriver")
+        return handler(*args)
+
+    def set_script_timeout(self, seconds: float):
+        self.script_timeout = seconds
+
+    def get_cookies(self) -> List[Dict[str, Any]]:
+        return [{"name": "session", "value": "fake"}]
+
+    def quit(self):
+        pass
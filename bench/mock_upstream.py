@@ -0,0 +1,214 @@
+"""
+本地替身上游：按 ChatHistoryResponse / ChatListResponse 的格式返回数据，
+可以在没有真实账号和网络的情况下测试直接 HTTP 模式。
+
+    python -m bench.mock_upstream --port 38001 --chars-per-second 200
+
+然后在 config.py 中设置 HTTP_BACKEND = True, API_BASE_URL = "http://127.0.0.1:38001"。
+"""
+import argparse
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query
+
+from HttpBackend import CHAT_LIST_API_PATH, CHAT_LIST_CURSOR_PARAM, DELETE_CHAT_API_PATH, HISTORY_API_PATH
+
+
+@dataclass
+class MockChat:
+    id: str
+    prompt: str
+    answer: str
+    thinking: str
+    inserted_at: float
+    chars_per_second: float
+    seq_id: int = 0
+    turn_started_at: float = 0.0
+    """当前这一轮开始生成的时间"""
+    previous_turns: List[Tuple[str, str]] = field(default_factory=list)
+    """已经完成的 (提问, 回答)"""
+
+    def __post_init__(self):
+        self.turn_started_at = self.turn_started_at or self.inserted_at
+
+    def progress(self, now: Optional[float] = None) -> int:
+        """当前这一轮已经生成的字符数（思考内容在前，回答在后）"""
+        now = time.time() if now is None else now
+        return int((now - self.turn_started_at) * self.chars_per_second)
+
+    def finished(self, now: Optional[float] = None) -> bool:
+        return self.progress(now) >= len(self.thinking) + len(self.answer)
+
+
+def _message(message_id: int, parent_id: Optional[int], role: str, status: str,
+             content: str, thinking: Optional[str], inserted_at: float) -> Dict[str, Any]:
+    return {
+        "message_id": message_id,
+        "parent_id": parent_id,
+        "model": "",
+        "role": role,
+        "thinking_enabled": thinking is not None,
+        "ban_edit": False,
+        "ban_regenerate": False,
+        "status": status,
+        "accumulated_token_usage": len(content),
+        "files": [],
+        "inserted_at": inserted_at,
+        "search_enabled": False,
+        "feedback": None,
+        "content": content,
+        "thinking_content": thinking,
+        "thinking_elapsed_secs": None,
+        "tips": [],
+        "search_status": None,
+        "search_results": None,
+    }
+
+
+class MockUpstream:
+    """
+    模拟上游的会话状态，回答按固定速度逐字生成
+    """
+
+    def __init__(self, chars_per_second: float = 200.0, answer: str = "", thinking: str = ""):
+        self.chars_per_second = chars_per_second
+        self.answer = answer or "This is a simulated answer. " * 20
+        self.thinking = thinking
+        self.chats: Dict[str, MockChat] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def create_chat(self, prompt: str) -> MockChat:
+        with self._lock:
+            self._seq += 1
+            chat = MockChat(
+                id=str(uuid.uuid4()),
+                prompt=prompt,
+                answer=self.answer,
+                thinking=self.thinking,
+                inserted_at=time.time(),
+                chars_per_second=self.chars_per_second,
+                seq_id=self._seq,
+            )
+            self.chats[chat.id] = chat
+            return chat
+
+    def continue_chat(self, chat_id: str, prompt: str) -> MockChat:
+        """在已有会话中开始新的一轮"""
+        with self._lock:
+            chat = self.chats[chat_id]
+            chat.previous_turns.append((chat.prompt, chat.answer))
+            chat.prompt = prompt
+            chat.turn_started_at = time.time()
+            return chat
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self._lock:
+            return self.chats.pop(chat_id, None) is not None
+
+    def _session(self, chat: MockChat) -> Dict[str, Any]:
+        return {
+            "id": chat.id,
+            "seq_id": chat.seq_id,
+            "agent": "chat",
+            "character": None,
+            "title": chat.prompt[:20],
+            "title_type": "SYSTEM",
+            "version": 2 * len(chat.previous_turns) + 2,
+            "current_message_id": 2 * len(chat.previous_turns) + 2,
+            "pinned": False,
+            "inserted_at": chat.inserted_at,
+            "updated_at": chat.turn_started_at,
+        }
+
+    def history(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            return None
+        now = time.time()
+        generated = chat.progress(now)
+        thinking = chat.thinking[:generated] if chat.thinking else None
+        content = chat.answer[:max(generated - len(chat.thinking), 0)]
+        status = "FINISHED" if chat.finished(now) else "WIP"
+        messages = []
+        for turn, (prompt, answer) in enumerate(chat.previous_turns):
+            messages.append(_message(2 * turn + 1, 2 * turn or None, "USER", "FINISHED", prompt, None, chat.inserted_at))
+            messages.append(_message(2 * turn + 2, 2 * turn + 1, "ASSISTANT", "FINISHED", answer, None, chat.inserted_at))
+        user_id = 2 * len(chat.previous_turns) + 1
+        messages.append(_message(user_id, user_id - 1 or None, "USER", "FINISHED", chat.prompt, None, chat.turn_started_at))
+        messages.append(_message(user_id + 1, user_id, "ASSISTANT", status, content, thinking, chat.turn_started_at))
+        return {
+            "code": 0,
+            "msg": "",
+            "data": {
+                "biz_code": 0,
+                "biz_msg": "",
+                "biz_data": {
+                    "chat_session": self._session(chat),
+                    "chat_messages": messages,
+                    "cache_valid": False,
+                    "route_id": None,
+                },
+            },
+        }
+
+    def chat_list(self, count: int = 50, before: Optional[float] = None) -> Dict[str, Any]:
+        """按 updated_at 从新到旧分页，before 为翻页游标"""
+        chats: List[MockChat] = sorted(self.chats.values(), key=lambda c: c.turn_started_at, reverse=True)
+        if before is not None:
+            chats = [chat for chat in chats if chat.turn_started_at <= before]
+        return {
+            "code": 0,
+            "msg": "",
+            "data": {
+                "biz_code": 0,
+                "biz_msg": "",
+                "biz_data": {
+                    "chat_sessions": [self._session(chat) for chat in chats[:count]],
+                    "has_more": len(chats) > count,
+                },
+            },
+        }
+
+
+def create_app(upstream: MockUpstream) -> FastAPI:
+    app = FastAPI()
+
+    @app.get(HISTORY_API_PATH)
+    async def history(chat_session_id: str):
+        data = upstream.history(chat_session_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="chat session not found")
+        return data
+
+    @app.get(CHAT_LIST_API_PATH)
+    async def chat_list(count: int = Query(50), before: Optional[float] = Query(None, alias=CHAT_LIST_CURSOR_PARAM)):
+        return upstream.chat_list(count, before)
+
+    @app.post(DELETE_CHAT_API_PATH)
+    async def delete_chat(body: dict):
+        if not upstream.delete_chat(body.get("chat_session_id", "")):
+            raise HTTPException(status_code=404, detail="chat session not found")
+        return {"code": 0, "msg": "", "data": {"biz_code": 0, "biz_msg": "", "biz_data": None}}
+
+    @app.post("/mock/chats")
+    async def create_chat(body: dict):
+        chat = upstream.create_chat(body.get("prompt", ""))
+        return {"id": chat.id}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=38001)
+    parser.add_argument("--chars-per-second", type=float, default=200.0)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(MockUpstream(args.chars_per_second)), host="127.0.0.1", port=args.port)
@@ -1,27 +1,49 @@
 import asyncio
+import fnmatch
 import inspect
+import itertools
 import logging
+import re
 from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, Any, Optional, Union, List, Dict
+from typing import Callable, Any, Optional, Union, List, Dict, Tuple
 from functools import partial
 from .exceptions import EventTimeout, EventExecutionError
 
 logger = logging.getLogger(__name__)
 
+def is_pattern(event_name: str) -> bool:
+    """Whether an event name is a wildcard subscription such as 'chat.*'."""
+    return any(c in event_name for c in '*?[')
+
+
 class EventHub:
-    def __init__(self, max_workers: int = 10, mode: str = 'auto'):
+    """
+    Event names may be namespaced with dots ('chat.delta'). Handlers registered with a
+    wildcard pattern ('chat.*', '*') receive every matching event, ordered by priority
+    together with the exact-name handlers.
+    
+    Handlers for each emitted event name are resolved once into an immutable tuple and
+    cached; the cache is dropped whenever a handler is added or removed.
+    """
+
+    def __init__(self, max_workers: int = 10, mode: str = 'auto', max_concurrency: Optional[int] = None):
         """
         Initialize the event hub.
         
         :param max_workers: Max threads for thread pool (when using threaded mode)
         :param mode: 'auto' (detect async), 'async' or 'threaded'
+        :param max_concurrency: Default limit of handlers running at once per emit_concurrent call (None for no limit)
         """
-        self._events: Dict[str, List[Dict]] = {}
-        self._once_events: Dict[str, List[Dict]] = {}
+        self._events: Dict[str, Tuple[Dict, ...]] = {}
+        self._once_events: Dict[str, Tuple[Dict, ...]] = {}
+        self._patterns: Dict[str, re.Pattern] = {}
+        self._dispatch: Dict[str, Tuple[Dict, ...]] = {}
+        self._sequence = itertools.count()
         self._mode = mode
-        self._loop = asyncio.get_event_loop() if mode != 'threaded' else None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._executor = ThreadPoolExecutor(max_workers=max_workers) if mode != 'async' else None
         self._default_timeout = 60
+        self._max_concurrency = max_concurrency
         
         
     def on(self, 
@@ -37,16 +59,10 @@ class EventHub:
         :param priority: Higher priority handlers execute first
         :param is_async: Whether handler is async (None for auto-detect)
         """
-        if is_async is None:
-            is_async = inspect.iscoroutinefunction(handler)
-            
-        self._events.setdefault(event_name, []).append({
-            'handler': handler,
-            'priority': priority,
-            'is_async': is_async
-        })
-        
-        self._events[event_name].sort(key=lambda x: -x['priority'])
+        self._events[event_name] = self._events.get(event_name, ()) + (
+            self._handler_info(event_name, handler, priority, is_async),
+        )
+        self._invalidate()
         
     def once(self, 
              event_name: str, 
@@ -56,16 +72,9 @@ class EventHub:
         """
         Register a one-time event handler.
         """
-        if is_async is None:
-            is_async = inspect.iscoroutinefunction(handler)
-            
-        self._once_events.setdefault(event_name, []).append({
-            'handler': handler,
-            'priority': priority,
-            'is_async': is_async
-        })
-        
-        self._once_events[event_name].sort(key=lambda x: -x['priority'])
+        self._once_events[event_name] = self._once_events.get(event_name, ()) + (
+            self._handler_info(event_name, handler, priority, is_async),
+        )
         
     def off(self, event_name: str, handler: Optional[Callable] = None):
         """
@@ -77,8 +86,49 @@ class EventHub:
         if handler is None:
             self._events.pop(event_name, None)
         else:
-            handlers = self._events.get(event_name, [])
-            self._events[event_name] = [h for h in handlers if h['handler'] != handler]
+            handlers = self._events.get(event_name, ())
+            self._events[event_name] = tuple(h for h in handlers if h['handler'] != handler)
+        self._invalidate()
+
+    def _handler_info(self, event_name: str, handler: Callable, priority: int, is_async: Optional[bool]) -> Dict:
+        if is_async is None:
+            is_async = inspect.iscoroutinefunction(handler)
+        if is_pattern(event_name) and event_name not in self._patterns:
+            self._patterns[event_name] = re.compile(fnmatch.translate(event_name))
+        return {
+            'handler': handler,
+            'priority': priority,
+            'is_async': is_async,
+            'sequence': next(self._sequence)
+        }
+
+    def _matches(self, key: str, event_name: str) -> bool:
+        pattern = self._patterns.get(key)
+        return key == event_name if pattern is None else pattern.match(event_name) is not None
+
+    def _invalidate(self):
+        # Rebind instead of clearing, so a lookup racing with this change fills the old dict
+        self._dispatch = {}
+
+    def _handlers_for(self, event_name: str) -> Tuple[Dict, ...]:
+        """Resolve the handlers of an event name, including one-time handlers, which are consumed."""
+        dispatch = self._dispatch
+        handlers = dispatch.get(event_name)
+        if handlers is None:
+            matched = [h for key, infos in list(self._events.items()) if self._matches(key, event_name) for h in infos]
+            matched.sort(key=lambda h: (-h['priority'], h['sequence']))
+            handlers = dispatch[event_name] = tuple(matched)
+
+        if not self._once_events:
+            return handlers
+
+        once = []
+        for key in [key for key in list(self._once_events) if self._matches(key, event_name)]:
+            once.extend(self._once_events.pop(key, ()))
+        if not once:
+            return handlers
+        once.sort(key=lambda h: (-h['priority'], h['sequence']))
+        return handlers + tuple(once)
             
     async def emit(self, 
                    event_name: str, 
@@ -96,7 +146,7 @@ class EventHub:
             timeout = self._default_timeout
             
         
-        all_handlers = self._events.get(event_name, []) + self._once_events.pop(event_name, [])
+        all_handlers = self._handlers_for(event_name)
         
         if not all_handlers:
             return []
@@ -113,11 +163,65 @@ class EventHub:
                     **kwargs
                 )
                 results.append(result)
+            except EventTimeout:
+                logger.error(f"Handler for event {event_name} timed out after {timeout}s")
+                raise
             except Exception as e:
                 logger.error(f"Error executing handler for event {event_name}: {str(e)}")
                 raise EventExecutionError(f"Handler failed for event {event_name}") from e
                 
         return results
+
+    async def emit_concurrent(self,
+                              event_name: str,
+                              *args,
+                              timeout: Optional[float] = None,
+                              max_concurrency: Optional[int] = None,
+                              **kwargs) -> List[Any]:
+        """
+        Emit an event to all handlers at once and wait for them together.
+        
+        Each handler gets its own timeout, so one slow handler does not delay or fail the others.
+        The returned list follows handler order; a handler that failed contributes its exception
+        instead of a result: EventTimeout if it timed out, EventExecutionError otherwise.
+        
+        :param event_name: Name of event to emit
+        :param timeout: Max time for each handler (None for the default timeout)
+        :param max_concurrency: Max handlers running at once for this event (None for the hub default)
+        :return: List of results or exceptions, one per handler
+        """
+        if timeout is None:
+            timeout = self._default_timeout
+        if max_concurrency is None:
+            max_concurrency = self._max_concurrency
+
+        all_handlers = self._handlers_for(event_name)
+
+        if not all_handlers:
+            return []
+
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run(handler_info: Dict) -> Any:
+            try:
+                if semaphore is None:
+                    return await self._execute_handler(
+                        handler_info['handler'], handler_info['is_async'], *args, timeout=timeout, **kwargs
+                    )
+                async with semaphore:
+                    return await self._execute_handler(
+                        handler_info['handler'], handler_info['is_async'], *args, timeout=timeout, **kwargs
+                    )
+            except EventTimeout as e:
+                logger.error(f"Handler for event {event_name} timed out after {timeout}s")
+                return e
+            except Exception as e:
+                logger.error(f"Error executing handler for event {event_name}: {str(e)}")
+                error = EventExecutionError(f"Handler failed for event {event_name}")
+                error.__cause__ = e
+                return error
+
+        return list(await asyncio.gather(*(run(handler_info) for handler_info in all_handlers)))
         
     async def _execute_handler(self, 
                               handler: Callable, 
@@ -127,7 +231,21 @@ class EventHub:
                               **kwargs) -> Any:
         """
         Execute a single handler with proper async/threaded handling.
+        
+        Raises EventTimeout when the handler does not finish within timeout. A threaded handler
+        that times out keeps running in its worker thread; only the wait is abandoned.
         """
+        try:
+            return await self._run_handler(handler, is_async, *args, timeout=timeout, **kwargs)
+        except asyncio.TimeoutError as e:
+            raise EventTimeout(f"Handler {getattr(handler, '__name__', handler)} timed out after {timeout}s") from e
+
+    async def _run_handler(self,
+                           handler: Callable,
+                           is_async: bool,
+                           *args,
+                           timeout: float,
+                           **kwargs) -> Any:
         if self._mode == 'auto':
             mode = 'async' if is_async else 'threaded'
         else:
@@ -145,9 +263,9 @@ class EventHub:
             
             loop = asyncio.get_running_loop()
             func = partial(handler, *args, **kwargs)
-            return await loop.run_in_executor(
-                self._executor,
-                func
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, func),
+                timeout=timeout
             )
             
     def set_default_timeout(self, timeout: float):
@@ -159,38 +277,55 @@ class EventHub:
         return list(self._events.keys())
         
     def has_listeners(self, event_name: str) -> bool:
-        """Check if an event has any listeners."""
-        return (event_name in self._events and bool(self._events[event_name])) or \
-               (event_name in self._once_events and bool(self._once_events[event_name]))
+        """Check if an event has any listeners, including wildcard subscriptions."""
+        handlers = self._dispatch.get(event_name)
+        if handlers is None:
+            handlers = any(infos and self._matches(key, event_name) for key, infos in list(self._events.items()))
+        return bool(handlers) or any(
+            infos and self._matches(key, event_name) for key, infos in list(self._once_events.items())
+        )
                
     async def close(self):
         """Cleanup resources."""
         if self._executor:
             self._executor.shutdown(wait=True)
     
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """
+        Set the event loop that emit_nowait schedules async handlers on.
+        
+        Needed when events are emitted from threads without a running loop, e.g. call it
+        from the application's startup hook with asyncio.get_running_loop().
+        
+        :param loop: A running event loop
+        """
+        self._loop = loop
+
     def emit_nowait(self, event_name: str, *args, **kwargs) -> None:
         """
         Emit an event without waiting for handlers to complete.
-        Can be used in synchronous context.
+        Can be used in synchronous context and from other threads.
+        
+        Async handlers run on the loop set with bind_loop, or on the caller's running loop;
+        without either they are skipped with a warning.
         
         :param event_name: Name of event to emit
         """
-        if not self.has_listeners(event_name):
+        all_handlers = self._handlers_for(event_name)
+        if not all_handlers:
             return
-            
-        
-        all_handlers = self._events.get(event_name, []) + self._once_events.pop(event_name, [])
         
         for handler_info in all_handlers:
             try:
                 if self._mode == 'async' or (self._mode == 'auto' and handler_info['is_async']):
                     
-                    if self._loop is None:
-                        self._loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(self._loop)
+                    loop = self._running_loop()
+                    if loop is None:
+                        logger.warning(f"No running event loop for async handler of event {event_name}")
+                        continue
                     
                     coro = handler_info['handler'](*args, **kwargs)
-                    asyncio.run_coroutine_threadsafe(coro, self._loop)
+                    asyncio.run_coroutine_threadsafe(coro, loop)
                 else:
                     
                     if self._executor is None:
@@ -202,4 +337,12 @@ class EventHub:
                         **kwargs
                     )
             except Exception as e:
-                logger.error(f"Error scheduling handler for event {event_name}: {str(e)}")
\ No newline at end of file
+                logger.error(f"Error scheduling handler for event {event_name}: {str(e)}")
+
+    def _running_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        if self._loop is not None and self._loop.is_running():
+            return self._loop
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
\ No newline at end of file
@@ -1,6 +1,6 @@
 import json
 import time
-from typing import AsyncGenerator, Dict, Generator, List, Union
+from typing import AsyncGenerator, AsyncIterator, Dict, Generator, List, Union
 from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 from openai.types.chat.completion_create_params import CompletionCreateParamsStreaming
 from openai.types.chat.chat_completion import ChatCompletion
@@ -87,3 +87,20 @@ def simulate_streaming_pp(id) -> Generator[bytes,None,None]:
     ).to_json(indent=None).encode('utf-8') + "\n\n".encode('utf-8')
 
     yield "data: [DONE]".encode('utf-8')
+
+async def stream_chunks(chunks: AsyncIterator[ChatCompletionChunk]) -> AsyncGenerator[bytes, None]:
+    """
+    把生成中的 ChatCompletionChunk 转换为 SSE 事件
+
+    响应头已经发出，生成过程中的异常无法再变成状态码，改为发送一个 error 事件后正常结束
+    """
+    try:
+        async for chunk in chunks:
+            yield "data: ".encode() + chunk.to_json(indent=None).encode('utf-8') + "\n\n".encode('utf-8')
+    except Exception as e:
+        error_type = "timeout" if isinstance(e, TimeoutError) else "server_error"
+        yield "data: ".encode() + json.dumps(
+            {"error": {"message": str(e), "type": error_type}}, ensure_ascii=False
+        ).encode('utf-8') + "\n\n".encode('utf-8')
+
+    yield "data: [DONE]".encode('utf-8') + "\n\n".encode('utf-8')